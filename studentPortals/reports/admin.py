@@ -2,13 +2,29 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import Student, Grade, Course, CourseReview, Profile
+from .models import Student, Grade, Course, CourseReview, CourseStats, ExportJob, Profile, Term, TermGPA, WaitlistEntry
 
 admin.site.register(Student)
 admin.site.register(Grade)
 admin.site.register(Course)
 admin.site.register(CourseReview)
 admin.site.register(Profile)
+admin.site.register(TermGPA)
+admin.site.register(WaitlistEntry)
+admin.site.register(ExportJob)
+admin.site.register(CourseStats)
+
+
+@admin.action(description="Close selected terms and freeze GPAs")
+def close_terms(modeladmin, request, queryset):
+    for term in queryset.filter(is_closed=False):
+        term.close()
+
+
+@admin.register(Term)
+class TermAdmin(admin.ModelAdmin):
+    list_display = ['name', 'start_date', 'is_closed']
+    actions = [close_terms]
 
 
 
@@ -1,14 +1,14 @@
-
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate, pre_migrate
 
 
 class ReportsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'reports'
-from django.apps import AppConfig
-
 
-class ReportsConfig(AppConfig):
-    default_auto_field = 'django.db.models.BigAutoField'
-    name = 'reports'
+    def ready(self):
+        from . import fragments  # noqa: F401 (connects the cache invalidation signals)
+        from .search import install_course_search, uninstall_course_search
 
+        pre_migrate.connect(uninstall_course_search, sender=self)
+        post_migrate.connect(install_course_search, sender=self)
@@ -1,23 +1,15 @@
+from .middleware import get_role
 
-from django.contrib.auth.decorators import user_passes_test
+# Roles come from RoleMiddleware's per-request lookup, not user.profile
 
 def student_required(user):
-    return user.is_authenticated and hasattr(user, 'profile') and user.profile.role == 'student'
+    return user.is_authenticated and get_role(user).role == 'student'
 
 def lecturer_required(user):
-    return user.is_authenticated and hasattr(user, 'profile') and user.profile.role == 'lecturer'
+    return user.is_authenticated and get_role(user).role == 'lecturer'
 
 def admin_required(user):
-    return user.is_authenticated and hasattr(user, 'profile') and user.profile.role == 'admin'
-
-from django.contrib.auth.decorators import user_passes_test
-
-def student_required(user):
-    return user.is_authenticated and hasattr(user, 'profile') and user.profile.role == 'student'
-
-def lecturer_required(user):
-    return user.is_authenticated and hasattr(user, 'profile') and user.profile.role == 'lecturer'
-
-def admin_required(user):
-    return user.is_authenticated and hasattr(user, 'profile') and user.profile.role == 'admin'
+    return user.is_authenticated and get_role(user).role == 'admin'
 
+def course_staff_required(user):
+    return user.is_authenticated and get_role(user).role in ('admin', 'lecturer')
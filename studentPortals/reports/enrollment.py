@@ -0,0 +1,248 @@
+import time
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Lower
+
+from .fragments import bump, student as student_version
+from .models import Course, Student, WaitlistEntry, sync_seats
+
+# Enrollment lives in the Course.students through table, which is unique
+# on (course, student); these helpers test and change one row of it at a
+# time instead of loading a course's roster.
+#
+# Seats are granted by a conditional UPDATE on Course.seats_taken
+# ("seats_taken < capacity"), which the database applies atomically: under
+# concurrent enrollers exactly `capacity` of them get a seat and the rest
+# go on the course's FIFO waitlist, served in id order whenever a seat
+# frees up.
+
+Enrollment = Course.students.through
+
+ENROLLED = 'enrolled'
+WAITLISTED = 'waitlisted'
+DROPPED = 'dropped'
+LEFT_WAITLIST = 'left_waitlist'
+
+
+def is_enrolled(student_id, course_id):
+    return Enrollment.objects.filter(course_id=course_id, student_id=student_id).exists()
+
+
+def is_waitlisted(student_id, course_id):
+    return WaitlistEntry.objects.filter(course_id=course_id, student_id=student_id).exists()
+
+
+def waitlist_position(student_id, course_id):
+    # 1-based place in the queue, or None if not waiting
+    entry = WaitlistEntry.objects.filter(course_id=course_id, student_id=student_id).values_list('pk', flat=True).first()
+    if entry is None:
+        return None
+    return WaitlistEntry.objects.filter(course_id=course_id, pk__lte=entry).count()
+
+
+def _take_seat(course_id):
+    # Claim one seat if the course has room; True if claimed. The row is
+    # locked until the transaction ends, so claims on a course serialise.
+    has_room = Q(capacity__isnull=True) | Q(seats_taken__lt=F('capacity'))
+    return Course.objects.filter(has_room, pk=course_id).update(seats_taken=F('seats_taken') + 1) == 1
+
+
+def enroll(student_id, course_id):
+    """Give the student a seat, or a waitlist place if the course is full.
+
+    Returns ENROLLED or WAITLISTED. Enrolling or queueing twice is a no-op.
+    """
+    with transaction.atomic():
+        if is_enrolled(student_id, course_id):
+            return ENROLLED
+        if is_waitlisted(student_id, course_id):
+            return WAITLISTED
+        if _take_seat(course_id):
+            # The M2M manager sends m2m_changed, which recounts seats_taken
+            Course(pk=course_id).students.add(student_id)
+            return ENROLLED
+        WaitlistEntry.objects.bulk_create(
+            [WaitlistEntry(course_id=course_id, student_id=student_id)], ignore_conflicts=True
+        )
+        bump(student_version(student_id))
+        return WAITLISTED
+
+
+def drop(student_id, course_id):
+    """Take the student out of the course and fill the freed seat from the
+    waitlist, or take them off the waitlist. Returns DROPPED or
+    LEFT_WAITLIST."""
+    with transaction.atomic():
+        if is_enrolled(student_id, course_id):
+            Course(pk=course_id).students.remove(student_id)
+            promote_waitlist(course_id)
+            return DROPPED
+        WaitlistEntry.objects.filter(course_id=course_id, student_id=student_id).delete()
+        bump(student_version(student_id))
+        return LEFT_WAITLIST
+
+
+def promote_waitlist(course_id):
+    """Enroll waitlisted students, first come first served, while the
+    course has free seats. Returns the ids of the students promoted."""
+    promoted = []
+    students = Course(pk=course_id).students
+    with transaction.atomic():
+        while True:
+            entry = WaitlistEntry.objects.filter(course_id=course_id).order_by('pk').first()
+            if entry is None:
+                break
+            if is_enrolled(entry.student_id, course_id):
+                # Enrolled some other way meanwhile; no seat needed
+                entry.delete()
+                continue
+            if not _take_seat(course_id):
+                break
+            entry.delete()
+            students.add(entry.student_id)
+            promoted.append(entry.student_id)
+    return promoted
+
+
+def toggle_course(student_id, course_id):
+    """Enroll the student in the course, or drop them if already enrolled
+    or waiting.
+
+    The membership check is an EXISTS on the unique index and the change
+    runs in the same transaction, so racing toggles can't create
+    duplicates or over-fill the course. Returns ENROLLED, WAITLISTED,
+    DROPPED or LEFT_WAITLIST.
+    """
+    with transaction.atomic():
+        if is_enrolled(student_id, course_id) or is_waitlisted(student_id, course_id):
+            return drop(student_id, course_id)
+        return enroll(student_id, course_id)
+
+
+# Bulk import: (email, course code) rows resolved a chunk at a time with one
+# lookup per table and inserted straight into the through table.
+
+IMPORT_CHUNK_SIZE = 1000
+# Errors kept for display; the total is still counted
+MAX_IMPORT_ERRORS = 500
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.existing = 0
+        self.error_count = 0
+        self.errors = []  # [(line number, message)]
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def error(self, line_no, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_IMPORT_ERRORS:
+            self.errors.append((line_no, message))
+
+
+# Both lookups match Lower() against the expression indexes
+# student_email_lower_idx and course_code_lower_idx
+
+def _students_by_email(emails):
+    rows = Student.objects.annotate(email_key=Lower('email')).filter(email_key__in=emails).values_list('email_key', 'pk')
+    return dict(rows)
+
+
+def _courses_by_code(codes):
+    # Codes aren't unique; an ambiguous code maps to None
+    by_code = {}
+    for code, pk in Course.objects.annotate(code_key=Lower('code')).filter(code_key__in=codes).values_list('code_key', 'pk'):
+        by_code[code] = pk if code not in by_code else None
+    return by_code
+
+
+def _import_chunk(chunk, result):
+    # chunk: [(line number, email, code)], already lower-cased
+    students = _students_by_email({email for _, email, _ in chunk})
+    courses = _courses_by_code({code for _, _, code in chunk})
+
+    wanted = defaultdict(dict)  # course id -> {student id: line number}
+    for line_no, email, code in chunk:
+        student_id, course_id = students.get(email), courses.get(code)
+        if student_id is None:
+            result.error(line_no, f"No student with email {email}")
+        elif course_id is None:
+            result.error(line_no, f"Course code {code} is ambiguous" if code in courses else f"No course with code {code}")
+        elif student_id in wanted[course_id]:
+            result.existing += 1  # repeated in the file
+        else:
+            wanted[course_id][student_id] = line_no
+    if not wanted:
+        return
+
+    with transaction.atomic():
+        # Lock the courses so seats can't be taken underneath us, then
+        # fill only the free seats
+        seats = {
+            pk: (capacity, taken) for pk, capacity, taken in
+            Course.objects.select_for_update().filter(pk__in=wanted).values_list('pk', 'capacity', 'seats_taken')
+        }
+        enrolled = set(
+            Enrollment.objects.filter(course_id__in=wanted, student_id__in={s for ids in wanted.values() for s in ids})
+            .values_list('course_id', 'student_id')
+        )
+        new_rows = []
+        for course_id, student_lines in wanted.items():
+            capacity, taken = seats[course_id]
+            room = None if capacity is None else capacity - taken
+            for student_id, line_no in student_lines.items():
+                if (course_id, student_id) in enrolled:
+                    result.existing += 1
+                elif room is not None and room <= 0:
+                    result.error(line_no, "Course is full")
+                else:
+                    new_rows.append(Enrollment(course_id=course_id, student_id=student_id))
+                    if room is not None:
+                        room -= 1
+
+        Enrollment.objects.bulk_create(new_rows, ignore_conflicts=True)
+        result.created += len(new_rows)
+        # bulk_create sends no m2m_changed: recount seats and clear any
+        # waitlist places the new enrollments fill
+        sync_seats(list(wanted))
+        added = {(row.course_id, row.student_id) for row in new_rows}
+        waiting = WaitlistEntry.objects.filter(
+            course_id__in=wanted, student_id__in={student_id for _, student_id in added}
+        ).values_list('pk', 'course_id', 'student_id')
+        WaitlistEntry.objects.filter(pk__in=[pk for pk, *pair in waiting if tuple(pair) in added]).delete()
+    bump('enrollments', *[student_version(student_id) for _, student_id in added])
+
+
+def import_enrollments(rows, chunk_size=IMPORT_CHUNK_SIZE):
+    """Enroll students in courses from (line number, email, course code) rows.
+
+    Emails and codes match case-insensitively. Valid rows are imported
+    even if others fail; each failure is recorded with its line number.
+    Pairs already enrolled are counted, not duplicated, and courses are
+    only filled up to capacity. Returns an ImportResult.
+    """
+    result = ImportResult()
+    start = time.perf_counter()
+    chunk = []
+    for line_no, email, code in rows:
+        result.rows += 1
+        email, code = (email or '').strip().lower(), (code or '').strip().lower()
+        if not email or not code:
+            result.error(line_no, "Both email and course code are required")
+            continue
+        chunk.append((line_no, email, code))
+        if len(chunk) >= chunk_size:
+            _import_chunk(chunk, result)
+            chunk = []
+    if chunk:
+        _import_chunk(chunk, result)
+    result.seconds = time.perf_counter() - start
+    return result
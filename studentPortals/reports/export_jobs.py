@@ -0,0 +1,114 @@
+import csv
+import datetime
+import io
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files import File
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .exports import EXPORTS
+from .models import ExportJob
+
+# Exports run on a small in-process thread pool instead of a request
+# thread. A request for an export that was already asked for within
+# REPORTS_EXPORT_DEDUPE_SECONDS gets that job (and its file) back instead
+# of starting another. With REPORTS_EXPORT_WORKERS = 0 jobs run inline
+# when the submitting transaction commits, which is handy for tests. Jobs
+# older than REPORTS_EXPORT_RETENTION_SECONDS are deleted, files and all,
+# whenever a new one is queued.
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.REPORTS_EXPORT_WORKERS, thread_name_prefix='reports-export'
+            )
+        return _executor
+
+
+def submit_export(kind, user=None):
+    """Return the job for a `kind` export, queueing a new one unless an
+    identical export was requested within the dedupe window."""
+    if kind not in EXPORTS:
+        raise KeyError(kind)
+    window = datetime.timedelta(seconds=getattr(settings, 'REPORTS_EXPORT_DEDUPE_SECONDS', 0))
+    with transaction.atomic():
+        recent = (
+            ExportJob.objects.filter(kind=kind, created_at__gte=timezone.now() - window)
+            .exclude(status=ExportJob.FAILED)
+            .order_by('-created_at')
+            .first()
+        )
+        if recent is not None:
+            return recent
+        job = ExportJob.objects.create(kind=kind, requested_by=user if user and user.is_authenticated else None)
+        transaction.on_commit(lambda: _start(job.pk))
+        delete_expired_exports()
+    return job
+
+
+def delete_expired_exports():
+    """Delete finished and failed jobs past the retention period, with
+    their files. Returns the number of jobs deleted."""
+    retention = getattr(settings, 'REPORTS_EXPORT_RETENTION_SECONDS', 0)
+    if not retention:
+        return 0
+    cutoff = timezone.now() - datetime.timedelta(seconds=retention)
+    expired = ExportJob.objects.filter(created_at__lt=cutoff, status__in=[ExportJob.DONE, ExportJob.FAILED])
+    # post_delete removes each job's file (see models.delete_export_file)
+    return expired.delete()[0]
+
+
+def _start(job_id):
+    if getattr(settings, 'REPORTS_EXPORT_WORKERS', 0):
+        _pool().submit(_run_in_thread, job_id)
+    else:
+        run_export(job_id)
+
+
+def _run_in_thread(job_id):
+    try:
+        run_export(job_id)
+    finally:
+        # Pool threads outlive the job; don't leave a connection open
+        connection.close()
+
+
+def run_export(job_id):
+    """Write the job's CSV under MEDIA_ROOT and record the outcome."""
+    # Claim the job; a job that is already running or finished is left alone
+    if not ExportJob.objects.filter(pk=job_id, status=ExportJob.PENDING).update(status=ExportJob.RUNNING):
+        return
+    job = ExportJob.objects.get(pk=job_id)
+    filename, header, rows = EXPORTS[job.kind]
+    try:
+        # Spooled through a temporary file so memory stays flat; the bytes
+        # match the streaming download of the same export
+        with tempfile.TemporaryFile() as tmp:
+            text = io.TextIOWrapper(tmp, encoding='utf-8', newline='')
+            writer = csv.writer(text)
+            writer.writerow(header)
+            count = 0
+            for row in rows():
+                writer.writerow(row)
+                count += 1
+            text.flush()
+            tmp.seek(0)
+            job.file.save(f'{job.pk}-{filename}', File(tmp), save=False)
+            text.detach()
+        job.row_count = count
+        job.status = ExportJob.DONE
+    except Exception as exc:
+        job.status = ExportJob.FAILED
+        job.error = repr(exc)
+    job.finished_at = timezone.now()
+    job.save(update_fields=['file', 'row_count', 'status', 'error', 'finished_at'])
@@ -0,0 +1,114 @@
+import csv
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.http import StreamingHttpResponse
+
+from .models import Course, CourseReview
+
+# Rows fetched per round trip while streaming an export
+CHUNK_SIZE = 2000
+
+
+class Echo:
+    # Pseudo-buffer for csv.writer: write() hands the formatted line back
+    # instead of storing it, so rows can be yielded one at a time
+    def write(self, value):
+        return value
+
+
+def stream_csv(filename, header, rows):
+    """StreamingHttpResponse that writes `header` then each row of `rows`.
+
+    `rows` is consumed lazily, so memory stays flat however large the
+    export is and the first bytes go out before the query finishes.
+    """
+    writer = csv.writer(Echo())
+
+    def lines():
+        yield writer.writerow(header)
+        for row in rows:
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(lines(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+# Row sources: each is a generator over a chunked (server-side cursor) query
+
+def course_rows():
+    courses = Course.objects.order_by('id').values_list('name', 'code', 'credit_units', 'lecturer__name')
+    yield from courses.iterator(chunk_size=CHUNK_SIZE)
+
+
+def students_per_course_rows():
+    # One ordered query over the Course.students through table, joining in
+    # just the three columns written; query count is independent of the
+    # number of courses
+    enrollments = Course.students.through.objects.order_by('course_id', 'id').values_list(
+        'course__name', 'student__name', 'student__email'
+    )
+    yield from enrollments.iterator(chunk_size=CHUNK_SIZE)
+
+
+def review_rows():
+    reviews = CourseReview.objects.select_related('course', 'student').only(
+        'rating', 'comment', 'course__name', 'student__name'
+    ).order_by('id')
+    for review in reviews.iterator(chunk_size=CHUNK_SIZE):
+        yield [review.course.name, review.student.name, review.rating, review.comment]
+
+
+SUMMARY_CACHE_KEY = 'reports:summary'
+
+
+def summary_counts():
+    """Headline counts for the summary export, computed in two queries.
+
+    "Total Students" counts enrollments (a student in two courses counts
+    twice), as the export always has. With REPORTS_SUMMARY_CACHE_TTL set the
+    result is cached for that many seconds.
+    """
+    ttl = getattr(settings, 'REPORTS_SUMMARY_CACHE_TTL', 0)
+    if ttl:
+        counts = cache.get(SUMMARY_CACHE_KEY)
+        if counts is not None:
+            return counts
+
+    # Only the students join is multi-valued, so course/lecturer counts use
+    # DISTINCT and Count('students') is one per enrollment row
+    counts = Course.objects.aggregate(
+        total_courses=Count('id', distinct=True),
+        total_students=Count('students'),
+        total_lecturers=Count('lecturer', distinct=True),
+    )
+    counts['total_reviews'] = CourseReview.objects.count()
+
+    if ttl:
+        cache.set(SUMMARY_CACHE_KEY, counts, ttl)
+    return counts
+
+
+def summary_rows():
+    counts = summary_counts()
+    yield ['Total Courses', counts['total_courses']]
+    yield ['Total Students', counts['total_students']]
+    yield ['Total Lecturers', counts['total_lecturers']]
+    yield ['Total Reviews', counts['total_reviews']]
+
+
+# Every export by name: (download filename, header row, row source). Used by
+# the streaming download views and by export jobs (see export_jobs.py).
+EXPORTS = {
+    'courses': ('courses.csv', ['Course Name', 'Code', 'Credit Units', 'Lecturer'], course_rows),
+    'students_per_course': ('students_per_course.csv', ['Course', 'Student Name', 'Email'], students_per_course_rows),
+    'reviews': ('course_reviews.csv', ['Course', 'Student', 'Rating', 'Comment'], review_rows),
+    'summary': ('system_summary.csv', ['Summary Type', 'Count'], summary_rows),
+}
+
+
+def stream_export(name):
+    filename, header, rows = EXPORTS[name]
+    return stream_csv(filename, header, rows())
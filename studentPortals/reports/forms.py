@@ -1,10 +1,122 @@
 
+import csv
+import io
+
 from django import forms
 from .models import Course
 
 class CourseForm(forms.ModelForm):
     class Meta:
         model = Course
-        fields = ['name', 'code', 'credit_units']
+        fields = ['name', 'code', 'credit_units', 'capacity', 'term']
+
+
+class CourseEditForm(CourseForm):
+    # The fields edit_course posts; the lecturer is picked separately
+    class Meta(CourseForm.Meta):
+        fields = ['name', 'code', 'credit_units', 'capacity']
+
+
+
+
+class BulkGradeForm(forms.Form):
+    # Scores for a whole course: typed into the roster table (score_<id>
+    # fields) and/or uploaded as a CSV with "email,score" columns.
+    # Everything is validated before anything is saved.
+    csv_file = forms.FileField(required=False, help_text='CSV with columns: email, score')
+
+    def __init__(self, *args, roster=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # roster: the course's students, enrolled or already graded
+        self.roster = list(roster or [])
+        for student in self.roster:
+            self.fields[f'score_{student.id}'] = forms.IntegerField(
+                required=False, min_value=0, max_value=100, label=student.name
+            )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        scores = {}
+        for student in self.roster:
+            score = cleaned_data.get(f'score_{student.id}')
+            if score is not None:
+                scores[student.id] = score
+
+        upload = cleaned_data.get('csv_file')
+        if upload:
+            by_email = {student.email.lower(): student.id for student in self.roster}
+            errors = []
+            text = io.TextIOWrapper(upload.file, encoding='utf-8-sig')
+            reader = csv.DictReader(text)
+            try:
+                # Header names are matched as in BulkEnrollmentForm, ignoring
+                # case and surrounding spaces
+                reader.fieldnames = [name.strip().lower() for name in reader.fieldnames or []]
+                # (line number, row), numbered by the line each row ends on
+                rows = [(reader.line_num, row) for row in reader]
+            except UnicodeDecodeError:
+                raise forms.ValidationError("The CSV file must be saved as UTF-8.")
+            except csv.Error as exc:
+                raise forms.ValidationError(f"Line {reader.line_num}: {exc}")
+            if not {'email', 'score'} <= set(reader.fieldnames):
+                raise forms.ValidationError("The first row must name the columns: email, score")
+            for line_no, row in rows:
+                email = (row.get('email') or '').strip().lower()
+                student_id = by_email.get(email)
+                if student_id is None:
+                    errors.append(f"Line {line_no}: {email or 'missing email'} is not on this course")
+                    continue
+                try:
+                    score = int((row.get('score') or '').strip())
+                except ValueError:
+                    errors.append(f"Line {line_no}: score must be a whole number")
+                    continue
+                if not 0 <= score <= 100:
+                    errors.append(f"Line {line_no}: score must be between 0 and 100")
+                    continue
+                scores[student_id] = score
+            if errors:
+                raise forms.ValidationError(errors)
+
+        if not scores:
+            raise forms.ValidationError("Enter at least one score or upload a CSV file.")
+        cleaned_data['scores'] = scores
+        return cleaned_data
+
+
+class BulkEnrollmentForm(forms.Form):
+    # CSV with "email,course_code" columns, one enrollment per row
+    csv_file = forms.FileField(help_text='CSV with columns: email, course_code')
 
+    def clean_csv_file(self):
+        # Read the whole file once here, so rows() can't hit a bad byte or
+        # a malformed row after earlier chunks have been imported
+        upload = self.cleaned_data['csv_file']
+        text = io.TextIOWrapper(upload.file, encoding='utf-8-sig')
+        try:
+            reader = csv.reader(text)
+            header = next(reader, [])
+            for _ in reader:
+                pass
+        except UnicodeDecodeError:
+            raise forms.ValidationError("The CSV file must be saved as UTF-8.")
+        except csv.Error as exc:
+            raise forms.ValidationError(f"Line {reader.line_num}: {exc}")
+        finally:
+            text.detach()  # leave the upload open for rows()
+        upload.seek(0)
+        columns = {name.strip().lower() for name in header}
+        if not {'email', 'course_code'} <= columns:
+            raise forms.ValidationError("The first row must name the columns: email, course_code")
+        return upload
 
+    def rows(self):
+        # (line number, email, course code) for each data row, read lazily;
+        # clean_csv_file has already checked the whole file parses
+        text = io.TextIOWrapper(self.cleaned_data['csv_file'].file, encoding='utf-8-sig')
+        reader = csv.DictReader(text)
+        reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+        for row in reader:
+            # line_num is where the row ends, counting blank lines and
+            # line breaks inside quoted fields
+            yield reader.line_num, row.get('email'), row.get('course_code')
@@ -0,0 +1,132 @@
+import functools
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Course, CourseReview, Grade, Profile, Student
+
+# Versioned template fragments. Each kind of data the dashboards show has a
+# version counter in the cache: 'courses', 'grades', 'reviews',
+# 'enrollments', 'students' and 'profiles' for the whole table, and
+# 'student:<id>' for one student's grades, reviews and enrollments, and
+# 'role:<user id>' for the role RoleMiddleware keeps in a session. Signals
+# bump the counters on every write, and each {% cache %} block in the
+# dashboards varies on the counters of the data it shows, so a change
+# re-renders only the blocks that depend on it; stale copies simply expire.
+#
+# Writes that bypass signals (bulk_create, queryset update) call bump()
+# themselves.
+
+KEY_PREFIX = 'reports:version:'
+
+
+def _key(name):
+    return KEY_PREFIX + name
+
+
+def _initial():
+    # Counters start from the clock, so a counter that was evicted and
+    # recreated can't come back at a value an old fragment was cached under
+    return time.time_ns() // 1000
+
+
+def _incr(names):
+    for name in names:
+        try:
+            cache.incr(_key(name))
+        except ValueError:
+            cache.add(_key(name), _initial(), None)
+
+
+def bump(*names):
+    """Invalidate every fragment that depends on any of `names`.
+
+    Deferred until the current transaction commits, so no request can
+    cache the old data under the new version (and a rollback bumps nothing).
+    """
+    if names:
+        transaction.on_commit(functools.partial(_incr, names))
+
+
+def fragment_versions(fragments):
+    """{fragment: version string} for {fragment: [counter names]}, read in
+    one cache round trip. Pass the strings as the {% cache %} vary-on args."""
+    names = {name for deps in fragments.values() for name in deps}
+    current = cache.get_many([_key(name) for name in names])
+    missing = {}
+    for name in names:
+        if _key(name) not in current:
+            missing[_key(name)] = _initial()
+    if missing:
+        cache.set_many(missing, None)
+        current.update(missing)
+    return {
+        fragment: '.'.join(str(current[_key(name)]) for name in deps)
+        for fragment, deps in fragments.items()
+    }
+
+
+def lazy(func):
+    # A zero-argument context value that templates call at most once, and
+    # only if the block using it isn't served from the cache
+    return functools.cache(func)
+
+
+def student(student_id):
+    return f'student:{student_id}'
+
+
+def role(user_id):
+    return f'role:{user_id}'
+
+
+@receiver([post_save, post_delete], sender=Course)
+def course_changed(sender, **kwargs):
+    bump('courses')
+
+
+@receiver([post_save, post_delete], sender=Grade)
+def grade_changed(sender, instance, **kwargs):
+    bump('grades', student(instance.student_id))
+
+
+@receiver([post_save, post_delete], sender=CourseReview)
+def review_changed(sender, instance, **kwargs):
+    bump('reviews', student(instance.student_id))
+
+
+@receiver([post_save, post_delete], sender=Student)
+def student_changed(sender, instance, **kwargs):
+    # Users are linked to a Student by Student.user or by email (see
+    # middleware.resolve_role)
+    user_ids = User.objects.filter(email=instance.email).values_list('pk', flat=True) if instance.email else []
+    if instance.user_id is not None:
+        user_ids = [instance.user_id, *user_ids]
+    bump('students', student(instance.pk), *[role(pk) for pk in user_ids])
+
+
+@receiver([post_save, post_delete], sender=Profile)
+def profile_changed(sender, instance, **kwargs):
+    bump('profiles', role(instance.user_id))
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, **kwargs):
+    # A new email can link the user to a different Student
+    bump(role(instance.pk))
+
+
+@receiver(m2m_changed, sender=Course.students.through)
+def enrollment_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and not reverse:
+        instance._cleared_student_ids = list(instance.students.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        student_ids = [instance.pk] if reverse else pk_set
+        bump('enrollments', *[student(pk) for pk in student_ids])
+    elif action == 'post_clear':
+        student_ids = [instance.pk] if reverse else getattr(instance, '_cleared_student_ids', [])
+        bump('enrollments', *[student(pk) for pk in student_ids])
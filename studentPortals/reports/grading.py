@@ -0,0 +1,10 @@
+from .models import letter_for_score
+
+# The letter-grade rules over many scores at once, for bulk grade entry and
+# generated data: each score is graded by letter_for_score, so None,
+# strings and floats are handled exactly as they are one at a time.
+
+
+def letters_for_scores(scores):
+    """[letter_for_score(score) for score in scores], as a list."""
+    return [letter_for_score(score) for score in scores]
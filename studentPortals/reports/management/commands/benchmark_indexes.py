@@ -0,0 +1,93 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from reports.models import Course, CourseReview, Grade, Profile
+
+# Indexes/constraints added for the hot lookups below, as (model, name)
+LOOKUP_INDEXES = [
+    (Grade, 'unique_grade_per_course'),
+    (CourseReview, 'unique_review_per_course'),
+    (Course, 'course_code_idx'),
+    (Profile, 'profile_role_idx'),
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Show query plans and timings for hot lookups with and without their indexes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def hot_queries(self):
+        # Representative values taken from the current data
+        grade = Grade.objects.order_by('-id').first()
+        review = CourseReview.objects.order_by('-id').first()
+        course = Course.objects.order_by('-id').first()
+        student_id = grade.student_id if grade else 0
+        return [
+            ('Grade by student+course', Grade.objects.filter(
+                student_id=student_id, course_id=grade.course_id if grade else 0)),
+            ('CourseReview by student+course', CourseReview.objects.filter(
+                student_id=review.student_id if review else 0, course_id=review.course_id if review else 0)),
+            ('Course by lecturer', Course.objects.filter(lecturer_id=course.lecturer_id if course else None)),
+            ('Course by code', Course.objects.filter(code=course.code if course else '')),
+            ('Profile by role', Profile.objects.filter(role='lecturer')),
+        ]
+
+    def measure(self, label, repeat):
+        self.stdout.write(self.style.MIGRATE_HEADING(label))
+        for name, queryset in self.hot_queries():
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                list(queryset.all())
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            self.stdout.write(f"  {name}: {best * 1000:.3f} ms")
+            for line in queryset.explain().splitlines():
+                self.stdout.write(f"      {line}")
+
+    def drop(self, editor, model, name):
+        meta = model._meta
+        for index in meta.indexes:
+            if index.name == name:
+                editor.remove_index(model, index)
+        for constraint in meta.constraints:
+            if constraint.name == name:
+                # SQLite drops constraints by rebuilding the table from the
+                # model, so hide this one from the model while it does
+                original = meta.constraints
+                meta.constraints = [c for c in original if c.name != name]
+                try:
+                    editor.remove_constraint(model, constraint)
+                finally:
+                    meta.constraints = original
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+
+        # "Before": drop the indexes inside a transaction that is rolled
+        # back afterwards (DDL is transactional on SQLite and PostgreSQL).
+        # SQLite only allows schema changes in a transaction once foreign
+        # key checks are off.
+        checks_disabled = connection.disable_constraint_checking()
+        try:
+            with transaction.atomic():
+                with connection.schema_editor(atomic=False) as editor:
+                    for model, name in LOOKUP_INDEXES:
+                        self.drop(editor, model, name)
+                self.measure("Without lookup indexes", repeat)
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            if checks_disabled:
+                connection.enable_constraint_checking()
+
+        self.measure("With lookup indexes", repeat)
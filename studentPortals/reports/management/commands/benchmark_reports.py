@@ -0,0 +1,275 @@
+import datetime
+import json
+import logging
+import math
+import platform
+import statistics
+import tempfile
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, RequestFactory
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from reports import utils
+from reports.export_jobs import run_export
+from reports.models import Course, CourseReview, ExportJob, Grade, Profile, Student
+from reports.profiling import profile_queries
+
+
+# URL names in reports.urls that are not timed, and why
+SKIPPED = {
+    'logout': "ends the session the other benchmarks run in",
+    'toggle_enrollment': "shadowed by student_detail, which has the same URL pattern",
+    'my_courses': "shadowed by course_list, which has the same URL pattern",
+    'add_review': "looks the student up by Student.user, which generated logins don't set; submit_review covers reviews",
+    'student_dashboard': "renders students/student_detail.html, which does not exist",
+    'delete_lecturer': "deletes the lecturer on GET",
+    'delete_course': "only deletes; the confirmation page template, reports/confirm_delete.html, does not exist",
+}
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time every reports view, CSV export and utils function against the current data and "
+        "write query counts and p50/p95 latencies as JSON (see generate_dataset)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=10, help="Timed runs per benchmark, after one warm-up run")
+        parser.add_argument('--output', default='benchmark-results.json')
+        parser.add_argument('--compare', help="An earlier results file to compare p50 latencies against")
+        parser.add_argument('--only', help="Run only benchmarks whose name contains this")
+
+    def handle(self, *args, **options):
+        self.fixtures = self.pick_fixtures()
+
+        results = []
+        # The query profiler would log every over-budget request and Django
+        # every failing one; both are recorded in the results instead
+        request_logger = logging.getLogger('django.request')
+        request_logger.disabled = True
+        # Export files go to a scratch MEDIA_ROOT that is removed afterwards
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], REPORTS_QUERY_PROFILING=False, MEDIA_ROOT=media_root,
+        ):
+            self.fixtures['export_job'] = self.make_export_job()
+            try:
+                benchmarks = self.views() + self.exports() + self.functions()
+                if options['only']:
+                    benchmarks = [b for b in benchmarks if options['only'] in b[0]]
+                for name, kind, run in benchmarks:
+                    result = self.measure(name, kind, run, options['repeat'])
+                    results.append(result)
+                    self.report(result)
+            finally:
+                request_logger.disabled = False
+                self.fixtures['export_job'].delete()
+
+        output = {
+            'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'repeat': options['repeat'],
+            'dataset': {
+                'students': Student.objects.count(),
+                'courses': Course.objects.count(),
+                'enrollments': Course.students.through.objects.count(),
+                'grades': Grade.objects.count(),
+                'reviews': CourseReview.objects.count(),
+            },
+            'results': results,
+            'skipped': SKIPPED,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            json.dump(output, f, indent=2)
+        self.stdout.write(f"Results written to {options['output']}")
+
+        if options['compare']:
+            self.compare(options['compare'], results)
+        failed = [r['name'] for r in results if r['error']]
+        if failed:
+            self.stderr.write(self.style.WARNING(f"{len(failed)} benchmarks failed: {', '.join(failed)}"))
+
+    def pick_fixtures(self):
+        # The busiest course with a lecturer login, one of its students, and
+        # an admin and student login to request pages as
+        course = (
+            Course.objects.filter(lecturer__user__isnull=False).select_related('lecturer__user')
+            .order_by('-seats_taken', 'pk').first()
+        )
+        admin = Profile.objects.filter(role='admin').select_related('user').order_by('pk').first()
+        student_login = (
+            Profile.objects.filter(role='student', student__isnull=False).select_related('user', 'student')
+            .order_by('pk').first()
+        )
+        if course is None or admin is None or student_login is None:
+            raise CommandError(
+                "Needs a course with a lecturer, an admin and a student login with a Student; "
+                "run generate_dataset first"
+            )
+        own_course = student_login.student.courses.order_by('pk').first() or course
+        roster_student = Student.objects.filter(grade__course=course).order_by('pk').first() or student_login.student
+        return {
+            'admin': admin.user,
+            'lecturer': course.lecturer.user,
+            'lecturer_profile': course.lecturer,
+            'student': student_login.user,
+            'course': course,
+            'own_course': own_course,
+            'me': student_login.student,
+            'roster_student': roster_student,
+        }
+
+    def make_export_job(self):
+        # A finished export for the job, status and download pages; deleted
+        # (with its file) once the benchmarks are done
+        job = ExportJob.objects.create(kind='summary', requested_by=self.fixtures['admin'])
+        run_export(job.pk)
+        job.refresh_from_db()
+        return job
+
+    def get(self, role, url_name, *args, method='get'):
+        # role None requests the page logged out
+        client = Client(raise_request_exception=True)
+        if role is not None:
+            client.force_login(self.fixtures[role])
+        url = reverse(url_name, args=args)
+
+        def run():
+            response = getattr(client, method)(url)
+            if getattr(response, 'streaming', False):
+                b''.join(response.streaming_content)
+            if response.status_code >= 400:
+                raise AssertionError(f"{method.upper()} {url} returned {response.status_code}")
+            return response.status_code
+        return run
+
+    def views(self):
+        f = self.fixtures
+        course, own_course, me, job = f['course'].pk, f['own_course'].pk, f['me'].pk, f['export_job'].pk
+        pages = [
+            (None, 'login'),
+            ('admin', 'admin_dashboard'),
+            ('admin', 'admin_courses'),
+            ('admin', 'admin_students'),
+            ('admin', 'admin_grades'),
+            ('admin', 'admin_reviews'),
+            ('admin', 'admin_lecturers'),
+            ('admin', 'admin_create_course'),
+            ('admin', 'admin_bulk_enroll'),
+            ('admin', 'admin_query_profile'),
+            ('admin', 'student_report', f['roster_student'].pk),
+            ('admin', 'admin_course_students', course),
+            ('admin', 'edit_lecturer', f['lecturer_profile'].pk),
+            ('admin', 'add_lecturer'),
+            ('admin', 'admin_export_job', job),
+            ('admin', 'admin_export_status', job),
+            ('admin', 'admin_export_download', job),
+            ('lecturer', 'lecturer_dashboard'),
+            ('lecturer', 'course_reviews', course),
+            ('lecturer', 'course_students', course),
+            ('lecturer', 'update_grade', course, f['roster_student'].pk),
+            ('lecturer', 'bulk_grades', course),
+            ('lecturer', 'create_course'),
+            ('lecturer', 'edit_course', course),
+            ('student', 'student_detail', me),
+            ('student', 'course_list', me),
+            ('student', 'submit_review', own_course),
+            ('student', 'login_redirect'),
+        ]
+        benchmarks = [(f'view:{url_name}', 'view', self.get(role, url_name, *args)) for role, url_name, *args in pages]
+        # Queues a new export each run; rolled back so no job is kept or started
+        submit = self.get('admin', 'admin_export_submit', 'courses', method='post')
+        return benchmarks + [('view:admin_export_submit', 'view', self.rolled_back(submit))]
+
+    def exports(self):
+        names = ['download_courses_csv', 'download_students_per_course_csv', 'download_reviews_csv', 'download_summary_csv']
+        return [(f'export:{name}', 'export', self.get('admin', name)) for name in names]
+
+    def rolled_back(self, action):
+        # For functions that write: run them, then undo the writes
+        def run():
+            try:
+                with transaction.atomic():
+                    action()
+                    raise Rollback
+            except Rollback:
+                pass
+        return run
+
+    def functions(self):
+        f = self.fixtures
+        course = f['course']
+        page = Student.objects.order_by('pk')[:utils.PAGE_SIZE]
+        request = RequestFactory().get('/')
+        scores = {entry['student'].pk: 75 for entry in utils.roster_entries(utils.course_roster(course)[:utils.PAGE_SIZE], course)}
+        return [
+            ('utils:gpa_summary', 'function', lambda: utils.gpa_summary(list(page))),
+            ('utils:with_grades', 'function', lambda: utils.gpa_summary(list(utils.with_grades(page)))),
+            ('utils:student_detail_data', 'function', lambda: utils.student_detail_data(Student.objects.get(pk=f['me'].pk))),
+            ('utils:annotate_gpa', 'function', lambda: list(utils.annotate_gpa(page))),
+            ('utils:recalculate_gpa', 'function', self.rolled_back(utils.recalculate_gpa)),
+            ('utils:students_with_gpa', 'function', lambda: utils.students_with_gpa(page)),
+            ('utils:top_students', 'function', lambda: list(utils.top_students())),
+            ('utils:save_course_grades', 'function', self.rolled_back(lambda: utils.save_course_grades(course, scores))),
+            ('utils:course_roster', 'function', lambda: utils.roster_entries(utils.course_roster(course)[:utils.PAGE_SIZE], course)),
+            ('utils:keyset_page', 'function', lambda: utils.keyset_page(utils.course_roster(course), request)),
+        ]
+
+    def measure(self, name, kind, run, repeat):
+        result = {'name': name, 'kind': kind, 'runs': 0, 'queries': None, 'error': None}
+        timings = []
+        try:
+            run()  # warm-up: caches, prepared statements, first-request setup
+            for _ in range(repeat):
+                with profile_queries() as profile:
+                    start = time.perf_counter()
+                    run()
+                    timings.append(time.perf_counter() - start)
+                result['queries'] = profile.count
+        except Exception as exc:
+            result['error'] = repr(exc)
+        if timings:
+            timings.sort()
+            result.update(
+                runs=len(timings),
+                min_ms=round(timings[0] * 1000, 3),
+                p50_ms=round(statistics.median(timings) * 1000, 3),
+                p95_ms=round(timings[math.ceil(len(timings) * 0.95) - 1] * 1000, 3),
+                max_ms=round(timings[-1] * 1000, 3),
+            )
+        return result
+
+    def report(self, result):
+        if result['error']:
+            self.stderr.write(f"{result['name']}: FAILED {result['error']}")
+        else:
+            self.stdout.write(
+                f"{result['name']:45s} {result['queries']:4d} queries  "
+                f"p50 {result['p50_ms']:9.2f} ms  p95 {result['p95_ms']:9.2f} ms"
+            )
+
+    def compare(self, path, results):
+        with open(path, encoding='utf-8') as f:
+            before = {r['name']: r for r in json.load(f)['results'] if not r.get('error')}
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Compared with {path}"))
+        for result in results:
+            old = before.get(result['name'])
+            if old is None or result['error']:
+                continue
+            change = (result['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100 if old['p50_ms'] else 0
+            line = (
+                f"{result['name']:45s} p50 {old['p50_ms']:9.2f} -> {result['p50_ms']:9.2f} ms ({change:+.0f}%)  "
+                f"queries {old['queries']} -> {result['queries']}"
+            )
+            self.stdout.write(self.style.WARNING(line) if change > 20 or result['queries'] > old['queries'] else line)
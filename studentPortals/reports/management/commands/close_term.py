@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from reports.models import Term
+
+
+class Command(BaseCommand):
+    help = "Close a term and freeze each student's GPA for it"
+
+    def add_arguments(self, parser):
+        parser.add_argument('term_id', type=int)
+
+    def handle(self, *args, **options):
+        try:
+            term = Term.objects.get(pk=options['term_id'])
+        except Term.DoesNotExist:
+            raise CommandError(f"Term {options['term_id']} does not exist")
+        term.close()
+        self.stdout.write(self.style.SUCCESS(f"Closed {term} ({term.gpa_snapshots.count()} GPA snapshots)"))
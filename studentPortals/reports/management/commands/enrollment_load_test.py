@@ -0,0 +1,126 @@
+import statistics
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from reports.enrollment import ENROLLED, WAITLISTED, drop, enroll
+from reports.models import Course, Student, WaitlistEntry
+
+
+class Command(BaseCommand):
+    help = (
+        "Race many concurrent enrollers against one capped course, then drop some of them, "
+        "and check that seats, the waitlist and promotions came out right"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--enrollers', type=int, default=300)
+        parser.add_argument('--capacity', type=int, default=50)
+        parser.add_argument('--drops', type=int, default=20)
+        parser.add_argument('--keep', action='store_true', help="Keep the generated course and students")
+
+    def handle(self, *args, **options):
+        enrollers, capacity, drops = options['enrollers'], options['capacity'], options['drops']
+        if connection.vendor == 'sqlite' and connection.settings_dict['NAME'] in ('', ':memory:'):
+            raise CommandError("Needs a database shared between threads, not in-memory SQLite")
+
+        tag = uuid.uuid4().hex[:8]
+        course = Course.objects.create(name=f'Load test {tag}', code=f'LOAD-{tag}', credit_units=1, capacity=capacity)
+        Student.objects.bulk_create(
+            [Student(name=f'Load {tag} {i}', email=f'load-{tag}-{i}@example.invalid') for i in range(enrollers)]
+        )
+        student_ids = list(Student.objects.filter(email__startswith=f'load-{tag}-').values_list('pk', flat=True))
+        try:
+            results = self.race(enroll, student_ids, course.pk, 'Enroll')
+            self.check_enroll(course, student_ids, results, capacity)
+
+            enrolled = list(course.students.values_list('pk', flat=True))
+            queue = list(WaitlistEntry.objects.filter(course=course).order_by('pk').values_list('student_id', flat=True))
+            dropped = enrolled[:drops]
+            self.race(drop, dropped, course.pk, 'Drop')
+            self.check_drops(course, dropped, queue, len(enrolled))
+        finally:
+            if not options['keep']:
+                course.delete()
+                Student.objects.filter(pk__in=student_ids).delete()
+
+        self.stdout.write(self.style.SUCCESS("All checks passed"))
+
+    def race(self, action, student_ids, course_id, label):
+        # One thread per student, all released at once
+        barrier = threading.Barrier(len(student_ids))
+        results, timings, errors = {}, [], []
+        lock = threading.Lock()
+
+        def worker(student_id):
+            try:
+                barrier.wait()
+                start = time.perf_counter()
+                outcome = action(student_id, course_id)
+                elapsed = time.perf_counter() - start
+                with lock:
+                    results[student_id] = outcome
+                    timings.append(elapsed)
+            except Exception as exc:
+                with lock:
+                    errors.append(f'{student_id}: {exc!r}')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(student_id,)) for student_id in student_ids]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - start
+
+        if errors:
+            raise CommandError(f"{label}: {len(errors)} of {len(student_ids)} failed, e.g. {errors[0]}")
+        timings.sort()
+        self.stdout.write(
+            f"{label}: {len(student_ids)} concurrent calls in {wall:.2f}s "
+            f"({len(student_ids) / wall:.0f}/s), p50 {statistics.median(timings) * 1000:.1f} ms, "
+            f"p95 {timings[int(len(timings) * 0.95) - 1] * 1000:.1f} ms"
+        )
+        return results
+
+    def check_enroll(self, course, student_ids, results, capacity):
+        course.refresh_from_db()
+        enrolled = set(course.students.values_list('pk', flat=True))
+        waiting = set(WaitlistEntry.objects.filter(course=course).values_list('student_id', flat=True))
+        expected_seats = min(capacity, len(student_ids))
+
+        self.expect(len(enrolled) == expected_seats, f"{len(enrolled)} enrolled, expected {expected_seats}")
+        self.expect(course.seats_taken == len(enrolled), f"seats_taken {course.seats_taken} != {len(enrolled)} enrolled")
+        self.expect(not enrolled & waiting, "students both enrolled and waitlisted")
+        self.expect(enrolled | waiting == set(student_ids), "students missing from both roster and waitlist")
+        self.expect(
+            {pk for pk, outcome in results.items() if outcome == ENROLLED} == enrolled
+            and {pk for pk, outcome in results.items() if outcome == WAITLISTED} == waiting,
+            "reported outcomes don't match the database",
+        )
+
+    def check_drops(self, course, dropped, queue, enrolled_before):
+        # Each freed seat goes to the longest-waiting student
+        course.refresh_from_db()
+        enrolled = set(course.students.values_list('pk', flat=True))
+        promoted = queue[:len(dropped)]
+
+        self.expect(not enrolled & set(dropped), "dropped students still enrolled")
+        self.expect(set(promoted) <= enrolled, "waitlist not promoted first come, first served")
+        self.expect(len(enrolled) == enrolled_before - len(dropped) + len(promoted),
+                    f"{len(enrolled)} enrolled after drops, expected {enrolled_before - len(dropped) + len(promoted)}")
+        self.expect(course.seats_taken == len(enrolled), f"seats_taken {course.seats_taken} != {len(enrolled)} enrolled")
+        self.expect(
+            list(WaitlistEntry.objects.filter(course=course).order_by('pk').values_list('student_id', flat=True))
+            == queue[len(promoted):],
+            "waitlist order changed",
+        )
+
+    def expect(self, condition, message):
+        if not condition:
+            raise CommandError(message)
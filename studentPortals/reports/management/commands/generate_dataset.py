@@ -0,0 +1,184 @@
+import datetime
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from reports.fragments import bump
+from reports.grading import letters_for_scores
+from reports.models import (
+    Course, CourseReview, Grade, Profile, Student, Term, rebuild_course_stats, sync_seats,
+)
+from reports.utils import recalculate_gpa
+
+# Generated rows are recognisable by these prefixes
+EMAIL_DOMAIN = 'bench.example.invalid'
+CODE_PREFIX = 'BEN'
+USERNAME_PREFIX = 'bench-'
+
+SUBJECTS = [
+    'Mathematics', 'Physics', 'Chemistry', 'Biology', 'Computer Science', 'Economics', 'History',
+    'Philosophy', 'Statistics', 'Engineering', 'Accounting', 'Law', 'Medicine', 'Literature',
+]
+LEVELS = ['Introduction to', 'Foundations of', 'Topics in', 'Advanced', 'Applied', 'Seminar in']
+COMMENTS = [
+    'Great course', 'Too much work', 'Clear lectures', 'Hard exams', 'Would recommend',
+    'Average', 'Well organised', 'Needs better materials', '',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with a synthetic university: students, lecturers, courses, terms, "
+        "enrollments, grades and reviews, written with bulk_create"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=50000)
+        parser.add_argument('--courses', type=int, default=2000)
+        parser.add_argument('--grades', type=int, default=1000000)
+        parser.add_argument('--reviews', type=int, default=200000)
+        parser.add_argument('--lecturers', type=int, default=400)
+        parser.add_argument('--terms', type=int, default=4, help="The latest term stays open, the rest are closed")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        students, courses = options['students'], options['courses']
+        if students < 1 or courses < 1 or options['terms'] < 1:
+            raise CommandError("Need at least one student, course and term")
+        if options['grades'] > students * courses:
+            raise CommandError("More grades than student/course pairs")
+        if Student.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').exists():
+            raise CommandError("A generated dataset is already present; use a fresh database")
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        start = time.perf_counter()
+        with transaction.atomic():
+            terms = self.make_terms(options['terms'])
+            lecturer_ids = self.make_staff(options['lecturers'])
+            course_terms = self.make_courses(courses, terms, lecturer_ids)
+            student_ids = self.make_students(students)
+            graded = self.make_grades(student_ids, course_terms, options['grades'])
+            self.make_reviews(graded, options['reviews'])
+
+            # bulk_create skips the signals and save() hooks that keep these up to date
+            self.step("Counting seats", lambda: sync_seats(list(course_terms)))
+            self.step("Building course stats", rebuild_course_stats)
+            self.step("Rebuilding stored GPAs", lambda: recalculate_gpa(Student.objects.filter(pk__in=student_ids)))
+            for term in terms[:-1]:
+                self.step(f"Closing {term.name}", term.close)
+            # Cached dashboard blocks can't have seen any of this yet
+            bump('courses', 'grades', 'reviews', 'enrollments', 'profiles')
+
+        self.stdout.write(self.style.SUCCESS(f"Dataset generated in {time.perf_counter() - start:.1f}s"))
+
+    def step(self, label, action):
+        start = time.perf_counter()
+        action()
+        self.stdout.write(f"{label}: {time.perf_counter() - start:.1f}s")
+
+    def bulk(self, model, rows):
+        # Write `rows` (any iterable) in batches; returns how many were written
+        count, batch = 0, []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                model.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            model.objects.bulk_create(batch)
+            count += len(batch)
+        return count
+
+    def make_terms(self, count):
+        today = datetime.date.today()
+        Term.objects.bulk_create([
+            Term(name=f'Bench term {i + 1}', start_date=today - datetime.timedelta(days=182 * (count - 1 - i)))
+            for i in range(count)
+        ])
+        return list(Term.objects.filter(name__startswith='Bench term ').order_by('start_date'))
+
+    def make_staff(self, lecturers):
+        # One admin and one student login for the benchmarks, plus the
+        # lecturers. bulk_create sends no post_save, so profiles are made here.
+        usernames = [f'{USERNAME_PREFIX}admin', f'{USERNAME_PREFIX}student'] + [
+            f'{USERNAME_PREFIX}lecturer-{i}' for i in range(lecturers)
+        ]
+        User.objects.bulk_create([User(username=name, email=f'{name}@{EMAIL_DOMAIN}') for name in usernames])
+        users = dict(User.objects.filter(username__in=usernames).values_list('username', 'pk'))
+        Profile.objects.bulk_create([
+            Profile(user_id=users[name], name=name, role=(
+                'admin' if name.endswith('admin') else 'student' if name.endswith('student') else 'lecturer'
+            ))
+            for name in usernames
+        ])
+        return list(Profile.objects.filter(role='lecturer', name__startswith=USERNAME_PREFIX).values_list('pk', flat=True))
+
+    def make_courses(self, count, terms, lecturer_ids):
+        rng = self.rng
+        self.step(f"{count} courses", lambda: self.bulk(Course, (
+            Course(
+                name=f'{rng.choice(LEVELS)} {rng.choice(SUBJECTS)} {i}',
+                code=f'{CODE_PREFIX}{i:05d}',
+                credit_units=rng.choice([2, 3, 3, 4, 4, 5]),
+                lecturer_id=rng.choice(lecturer_ids) if lecturer_ids else None,
+                term=rng.choice(terms),
+            )
+            for i in range(count)
+        )))
+        return dict(Course.objects.filter(code__startswith=CODE_PREFIX).values_list('pk', 'term_id'))
+
+    def make_students(self, count):
+        rng = self.rng
+        self.step(f"{count} students", lambda: self.bulk(Student, (
+            Student(name=f'Student {i} {rng.choice(SUBJECTS)}', email=f'student-{i}@{EMAIL_DOMAIN}')
+            for i in range(count)
+        )))
+        student_ids = list(
+            Student.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').order_by('pk').values_list('pk', flat=True)
+        )
+        # The benchmark student login gets the first student
+        Profile.objects.filter(name=f'{USERNAME_PREFIX}student').update(student_id=student_ids[0])
+        return student_ids
+
+    def make_grades(self, student_ids, course_terms, total):
+        # Spread `total` grades evenly over the students, each on distinct
+        # courses, and enroll every graded student in the course
+        rng = self.rng
+        course_ids = list(course_terms)
+        per_student, extra = divmod(total, len(student_ids))
+        graded = []
+        for i, student_id in enumerate(student_ids):
+            count = per_student + (1 if i < extra else 0)
+            for course_id in rng.sample(course_ids, min(count, len(course_ids))):
+                graded.append((student_id, course_id))
+
+        scores = [min(100, max(0, int(rng.gauss(62, 15)))) for _ in graded]
+        letters = letters_for_scores(scores)
+
+        def grades():
+            for (student_id, course_id), score, letter in zip(graded, scores, letters):
+                yield Grade(
+                    student_id=student_id, course_id=course_id, score=score,
+                    letter=letter, term_id=course_terms[course_id],
+                )
+
+        Enrollment = Course.students.through
+        self.step(f"{len(graded)} grades", lambda: self.bulk(Grade, grades()))
+        self.step(f"{len(graded)} enrollments", lambda: self.bulk(Enrollment, (
+            Enrollment(student_id=student_id, course_id=course_id) for student_id, course_id in graded
+        )))
+        return graded
+
+    def make_reviews(self, graded, total):
+        rng = self.rng
+        pairs = rng.sample(graded, min(total, len(graded)))
+        self.step(f"{len(pairs)} reviews", lambda: self.bulk(CourseReview, (
+            CourseReview(student_id=student_id, course_id=course_id, rating=rng.randint(1, 5), comment=rng.choice(COMMENTS))
+            for student_id, course_id in pairs
+        )))
@@ -0,0 +1,29 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from reports.enrollment import IMPORT_CHUNK_SIZE, import_enrollments
+
+
+class Command(BaseCommand):
+    help = "Enroll students in courses from a CSV with email and course_code columns"
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        with open(options['csv_path'], newline='', encoding='utf-8-sig') as f:
+            reader = csv.DictReader(f)
+            if not {'email', 'course_code'} <= {name.strip().lower() for name in reader.fieldnames or []}:
+                raise CommandError("The first row must name the columns: email, course_code")
+            reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+            rows = ((line_no, row.get('email'), row.get('course_code')) for line_no, row in enumerate(reader, start=2))
+            result = import_enrollments(rows, chunk_size=options['chunk_size'])
+
+        for line_no, message in result.errors:
+            self.stderr.write(f"Line {line_no}: {message}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{result.rows} rows in {result.seconds:.2f}s ({result.rows_per_second:.0f} rows/s): "
+            f"{result.created} enrolled, {result.existing} already enrolled, {result.error_count} errors"
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from reports.utils import recalculate_gpa
+
+
+class Command(BaseCommand):
+    help = "Rebuild the stored Student.gpa and total_credits from existing grades"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = recalculate_gpa(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Recalculated GPA for {count} students"))
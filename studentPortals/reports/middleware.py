@@ -0,0 +1,106 @@
+import time
+
+from django.conf import settings
+from django.db.models import OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils.functional import SimpleLazyObject
+
+from .fragments import fragment_versions, role as role_version
+from .models import Profile, Student
+
+SESSION_KEY = 'reports_role'
+
+
+class UserRole:
+    """The signed-in user's profile id, role, display name and Student id.
+
+    Any of them may be None: anonymous users, users without a profile and
+    staff without a Student record all get a UserRole.
+    """
+
+    def __init__(self, profile_id=None, role=None, name='', student_id=None):
+        self.profile_id = profile_id
+        self.role = role
+        self.name = name
+        self.student_id = student_id
+
+    def as_dict(self):
+        return {'profile_id': self.profile_id, 'role': self.role, 'name': self.name, 'student_id': self.student_id}
+
+
+def resolve_role(user):
+    """Look up the UserRole for `user` in one query.
+
+    The Student is the profile's own link if set, otherwise the Student
+    owned by the user or sharing their email (as the views used to find it).
+    """
+    if not user.is_authenticated:
+        return UserRole()
+
+    owned = Student.objects.filter(Q(user_id=OuterRef('user_id')) | Q(email=OuterRef('user__email'))).order_by('id')
+    row = (
+        Profile.objects.filter(user_id=user.pk)
+        .annotate(student_pk=Coalesce('student_id', Subquery(owned.values('pk')[:1])))
+        .values('id', 'role', 'name', 'student_pk')
+        .first()
+    )
+    if row is None:
+        return UserRole()
+    return UserRole(row['id'], row['role'], row['name'], row['student_pk'])
+
+
+def get_role(user):
+    # The role RoleMiddleware attached to the user, or a fresh lookup when
+    # called outside a request
+    role = getattr(user, 'reports_role', None)
+    if role is None:
+        role = resolve_role(user)
+        user.reports_role = role
+    return role
+
+
+class RoleMiddleware:
+    """Resolve the user's role once and keep it in the session.
+
+    Sets request.reports_role (and the same object on request.user, for
+    user_passes_test checks). Both are lazy, so views that never ask for a
+    role cost nothing. The session copy is tied to the user id and to the
+    user's 'role:<id>' version counter (see fragments.py), which every
+    Profile, Student or User change bumps, so a demotion takes effect on
+    the next request. It is trusted for at most REPORTS_ROLE_CACHE_TTL
+    seconds either way.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.reports_role = SimpleLazyObject(lambda: self.role_for(request))
+        user = request.user
+        request.user = SimpleLazyObject(lambda: self.attach_role(user, request.reports_role))
+        return self.get_response(request)
+
+    def attach_role(self, user, role):
+        user.reports_role = role
+        return user
+
+    def role_for(self, request):
+        user = request.user
+        if not user.is_authenticated:
+            return UserRole()
+
+        ttl = getattr(settings, 'REPORTS_ROLE_CACHE_TTL', 0)
+        if not ttl:
+            return resolve_role(user)
+
+        version = fragment_versions({'role': [role_version(user.pk)]})['role']
+        cached = request.session.get(SESSION_KEY)
+        if (
+            cached and cached.get('user_id') == user.pk and cached.get('version') == version
+            and time.time() - cached.get('at', 0) < ttl
+        ):
+            return UserRole(cached['profile_id'], cached['role'], cached['name'], cached['student_id'])
+
+        role = resolve_role(user)
+        request.session[SESSION_KEY] = dict(role.as_dict(), user_id=user.pk, version=version, at=time.time())
+        return role
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.8 on 2026-10-17 12:47
+
+from django.db import migrations, models
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+
+LETTER_POINTS = {'A': 5, 'B': 4, 'C': 3, 'D': 2, 'F': 0}
+
+
+def rebuild_gpa(apps, schema_editor):
+    # What utils.recalculate_gpa does: Student.gpa was never written before
+    # this, and Grade.save only applies deltas on top of the stored values
+    Student = apps.get_model('reports', 'Student')
+    points = Case(
+        *[When(grade__letter=letter, then=Value(value)) for letter, value in LETTER_POINTS.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    credit_units = 'grade__course__credit_units'
+    students = Student.objects.annotate(points=Sum(points * F(credit_units)), credits=Sum(credit_units))
+    batch = []
+    for student in students.order_by('id').iterator(chunk_size=1000):
+        student.total_credits = student.credits or 0
+        student.gpa = student.points / student.credits if student.credits else 0.0
+        batch.append(student)
+        if len(batch) >= 1000:
+            Student.objects.bulk_update(batch, ['gpa', 'total_credits'])
+            batch = []
+    Student.objects.bulk_update(batch, ['gpa', 'total_credits'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0007_profile_courses'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='total_credits',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(rebuild_gpa, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.8 on 2026-10-17 12:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0008_student_total_credits'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Term',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('start_date', models.DateField()),
+                ('is_closed', models.BooleanField(default=False)),
+            ],
+            options={
+                'ordering': ['start_date', 'id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='term',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='courses', to='reports.term'),
+        ),
+        migrations.AddField(
+            model_name='grade',
+            name='term',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='reports.term'),
+        ),
+        migrations.CreateModel(
+            name='TermGPA',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('points', models.IntegerField(default=0)),
+                ('credits', models.IntegerField(default=0)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='term_gpas', to='reports.student')),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='gpa_snapshots', to='reports.term')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('student', 'term'), name='unique_term_gpa')],
+            },
+        ),
+    ]
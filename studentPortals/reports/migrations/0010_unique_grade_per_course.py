@@ -0,0 +1,57 @@
+# Generated by Django 5.2.8 on 2026-10-17 12:52
+
+from django.db import migrations, models
+from django.db.models import Case, Count, F, IntegerField, Max, Sum, Value, When
+
+LETTER_POINTS = {'A': 5, 'B': 4, 'C': 3, 'D': 2, 'F': 0}
+
+
+def remove_duplicate_grades(apps, schema_editor):
+    # get_or_create could race and store two grades for the same
+    # student/course; keep the most recent one
+    Grade = apps.get_model('reports', 'Grade')
+    duplicates = (
+        Grade.objects.values('student_id', 'course_id')
+        .annotate(n=Count('id'), keep=Max('id'))
+        .filter(n__gt=1)
+    )
+    student_ids = set()
+    for row in duplicates:
+        Grade.objects.filter(student_id=row['student_id'], course_id=row['course_id']).exclude(id=row['keep']).delete()
+        student_ids.add(row['student_id'])
+    # Historical models send no post_delete, so the deleted grades are
+    # still counted in the stored GPA of these students
+    rebuild_gpa(apps, student_ids)
+
+
+def rebuild_gpa(apps, student_ids):
+    # utils.recalculate_gpa for `student_ids`
+    Student = apps.get_model('reports', 'Student')
+    points = Case(
+        *[When(grade__letter=letter, then=Value(value)) for letter, value in LETTER_POINTS.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    credit_units = 'grade__course__credit_units'
+    students = list(Student.objects.filter(pk__in=student_ids).annotate(
+        points=Sum(points * F(credit_units)), credits=Sum(credit_units)
+    ))
+    for student in students:
+        student.total_credits = student.credits or 0
+        student.gpa = student.points / student.credits if student.credits else 0.0
+    Student.objects.bulk_update(students, ['gpa', 'total_credits'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0009_term'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_grades, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='grade',
+            constraint=models.UniqueConstraint(fields=('student', 'course'), name='unique_grade_per_course'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.8 on 2026-10-17 12:54
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def remove_duplicate_reviews(apps, schema_editor):
+    # Keep each student's most recent review of a course
+    CourseReview = apps.get_model('reports', 'CourseReview')
+    duplicates = (
+        CourseReview.objects.values('student_id', 'course_id')
+        .annotate(n=Count('id'), keep=Max('id'))
+        .filter(n__gt=1)
+    )
+    for row in duplicates:
+        CourseReview.objects.filter(
+            student_id=row['student_id'], course_id=row['course_id']
+        ).exclude(id=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0010_unique_grade_per_course'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['code'], name='course_code_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['role'], name='profile_role_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_reviews, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='coursereview',
+            constraint=models.UniqueConstraint(fields=('student', 'course'), name='unique_review_per_course'),
+        ),
+    ]
@@ -0,0 +1,80 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def link_lecturers(apps, schema_editor):
+    # Resolve the free-text Course.lecturer to a lecturer (or admin) Profile
+    # by name, falling back to the username, then fill any still-unlinked
+    # course from the old Profile.courses assignments. Student profiles are
+    # never linked.
+    Course = apps.get_model('reports', 'Course')
+    Profile = apps.get_model('reports', 'Profile')
+    staff = Profile.objects.filter(role__in=('lecturer', 'admin'))
+
+    by_name = {}
+    for profile in staff.select_related('user').order_by('id'):
+        # The oldest profile wins a tie, except that a lecturer beats an admin
+        for key in (profile.name, profile.user.username):
+            key = (key or '').strip().lower()
+            if key and (key not in by_name or profile.role == 'lecturer' and by_name[key].role != 'lecturer'):
+                by_name[key] = profile
+
+    for course in Course.objects.all():
+        profile = by_name.get((course.lecturer or '').strip().lower())
+        if profile is not None:
+            course.lecturer_profile = profile
+            course.save(update_fields=['lecturer_profile'])
+
+    for profile in staff.prefetch_related('courses'):
+        Course.objects.filter(
+            pk__in=[course.pk for course in profile.courses.all()], lecturer_profile__isnull=True
+        ).update(lecturer_profile=profile)
+
+
+def unlink_lecturers(apps, schema_editor):
+    Course = apps.get_model('reports', 'Course')
+    for course in Course.objects.select_related('lecturer_profile'):
+        if course.lecturer_profile is not None:
+            course.lecturer = course.lecturer_profile.name
+            course.save(update_fields=['lecturer'])
+            course.lecturer_profile.courses.add(course)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0011_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='lecturer_profile',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='reports.profile'),
+        ),
+        migrations.RunPython(link_lecturers, unlink_lecturers),
+        # Give the old column a default so the removal can be reversed
+        migrations.AlterField(
+            model_name='course',
+            name='lecturer',
+            field=models.CharField(default='', max_length=200),
+        ),
+        migrations.RemoveField(
+            model_name='course',
+            name='lecturer',
+        ),
+        migrations.RemoveField(
+            model_name='profile',
+            name='courses',
+        ),
+        migrations.RenameField(
+            model_name='course',
+            old_name='lecturer_profile',
+            new_name='lecturer',
+        ),
+        migrations.AlterField(
+            model_name='course',
+            name='lecturer',
+            field=models.ForeignKey(blank=True, limit_choices_to={'role': 'lecturer'}, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='courses', to='reports.profile'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.8 on 2026-10-17 13:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_seats(apps, schema_editor):
+    Course = apps.get_model('reports', 'Course')
+    Enrollment = Course.students.through
+    enrollments = (
+        Enrollment.objects.filter(course_id=OuterRef('pk')).order_by().values('course_id')
+        .annotate(n=Count('*')).values('n')
+    )
+    Course.objects.update(seats_taken=Coalesce(Subquery(enrollments, output_field=IntegerField()), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0012_course_lecturer_fk'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='capacity',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='seats_taken',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_seats, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist', to='reports.course')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='reports.student')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['course', 'id'], name='waitlist_queue_idx')],
+                'constraints': [models.UniqueConstraint(fields=('course', 'student'), name='unique_waitlist_entry')],
+            },
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.8 on 2026-10-17 13:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+
+LETTERS = ['A', 'B', 'C', 'D', 'F']
+PASSING_LETTERS = ['A', 'B', 'C', 'D']
+
+
+def fill_stats(apps, schema_editor):
+    Course = apps.get_model('reports', 'Course')
+    Grade = apps.get_model('reports', 'Grade')
+    CourseReview = apps.get_model('reports', 'CourseReview')
+    CourseStats = apps.get_model('reports', 'CourseStats')
+
+    rows = {pk: CourseStats(course_id=pk) for pk in Course.objects.values_list('pk', flat=True)}
+    grades = Grade.objects.values('course_id').annotate(
+        grade_count=Count('id'),
+        score_total=Coalesce(Sum('score'), 0),
+        pass_count=Count('id', filter=Q(letter__in=PASSING_LETTERS)),
+        **{f'count_{letter.lower()}': Count('id', filter=Q(letter=letter)) for letter in LETTERS},
+    )
+    reviews = CourseReview.objects.values('course_id').annotate(
+        review_count=Count('id'), rating_total=Coalesce(Sum('rating'), 0),
+    )
+    for totals in [*grades, *reviews]:
+        row = rows[totals.pop('course_id')]
+        for field, value in totals.items():
+            setattr(row, field, value)
+    CourseStats.objects.bulk_create(rows.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0014_export_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseStats',
+            fields=[
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='reports.course')),
+                ('grade_count', models.IntegerField(default=0)),
+                ('score_total', models.IntegerField(default=0)),
+                ('count_a', models.IntegerField(default=0)),
+                ('count_b', models.IntegerField(default=0)),
+                ('count_c', models.IntegerField(default=0)),
+                ('count_d', models.IntegerField(default=0)),
+                ('count_f', models.IntegerField(default=0)),
+                ('pass_count', models.IntegerField(default=0)),
+                ('review_count', models.IntegerField(default=0)),
+                ('rating_total', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-17 13:51
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0015_course_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(django.db.models.functions.text.Lower('code'), name='course_code_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='student_email_lower_idx'),
+        ),
+    ]
@@ -1,29 +1,203 @@
 
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models.signals import post_save
+from django.db import models, transaction
+from django.db.models import Case, Count, F, FloatField, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, Lower, Round
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 
 
+LETTER_POINTS = {
+    'A': 5,
+    'B': 4,
+    'C': 3,
+    'D': 2,
+    'F': 0,
+}
+
+# Letters that count as Normal Progress (see Grade.np_status)
+PASSING_LETTERS = ('A', 'B', 'C', 'D')
+
+
+# Lowest score for each letter, best first; anything below the last is 'F'
+LETTER_THRESHOLDS = (
+    (70, 'A'),
+    (60, 'B'),
+    (50, 'C'),
+    (40, 'D'),
+)
+FAIL_LETTER = 'F'
+
+
+def letter_for_score(score):
+    try:
+        score = int(score)
+    except (TypeError, ValueError):
+        return FAIL_LETTER
+    for minimum, letter in LETTER_THRESHOLDS:
+        if score >= minimum:
+            return letter
+    return FAIL_LETTER
+
+
+def grade_point_expression(letter_field='letter'):
+    # Same mapping as LETTER_POINTS, as a SQL CASE over the stored letter
+    return Case(
+        *[When(**{letter_field: letter}, then=Value(points)) for letter, points in LETTER_POINTS.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
 # Create your models here.
+class Term(models.Model):
+    name = models.CharField(max_length=100)
+    start_date = models.DateField()
+    is_closed = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ['start_date', 'id']
+
+    def __str__(self):
+        return self.name
+
+    def close(self):
+        # Freeze every student's GPA for this term into TermGPA so CGPA can
+        # be folded from snapshots instead of rescanning old grades
+        with transaction.atomic():
+            self.freeze()
+            self.is_closed = True
+            self.save(update_fields=['is_closed'])
+
+    def freeze(self, student_ids=None):
+        # (Re)write the TermGPA snapshots of this term, for all students or
+        # just `student_ids`, from one grouped query
+        grades = Grade.objects.filter(term=self)
+        snapshots = TermGPA.objects.filter(term=self)
+        if student_ids is not None:
+            grades = grades.filter(student_id__in=student_ids)
+            snapshots = snapshots.filter(student_id__in=student_ids)
+        credit_units = F('course__credit_units')
+        totals = grades.values('student_id').annotate(
+            points=Sum(grade_point_expression() * credit_units), credits=Sum(credit_units)
+        )
+        with transaction.atomic():
+            snapshots.delete()
+            TermGPA.objects.bulk_create([
+                TermGPA(student_id=row['student_id'], term=self, points=row['points'], credits=row['credits'])
+                for row in totals
+            ], batch_size=1000)
+
+
 class Student(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True)
     name = models.CharField(max_length=200)
     email = models.EmailField(unique=True)
     gpa = models.FloatField(default=0)  # New field for GPA
+    total_credits = models.IntegerField(default=0)  # credit units behind gpa
+
+    class Meta:
+        indexes = [
+            # Case-insensitive email lookups (bulk enrollment import)
+            models.Index(Lower('email'), name='student_email_lower_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def adjust_gpa(cls, student_id, points, units):
+        # Fold a change of `points` (grade point x credit units) and `units`
+        # into the stored GPA in a single UPDATE, so concurrent grade saves
+        # can't overwrite each other's totals.
+        if not points and not units:
+            return
+        new_units = F('total_credits') + units
+        new_points = Round(F('gpa') * F('total_credits')) + points
+        cls.objects.filter(pk=student_id).update(
+            gpa=Case(
+                When(total_credits__gt=-units, then=Cast(new_points, FloatField()) / Cast(new_units, FloatField())),
+                default=Value(0.0),
+                output_field=FloatField(),
+            ),
+            total_credits=new_units,
+        )
+
+
+def enrollment_count_expression():
+    # Number of students enrolled in the outer query's course, as a
+    # correlated subquery on the Course.students through table
+    enrollments = (
+        Course.students.through.objects.filter(course_id=OuterRef('pk'))
+        .order_by()
+        .values('course_id')
+        .annotate(n=Count('*'))
+        .values('n')
+    )
+    return Coalesce(Subquery(enrollments, output_field=IntegerField()), 0)
+
 
 class Course(models.Model):
     name = models.CharField(max_length=200)
     code = models.CharField(max_length=200)
     credit_units = models.IntegerField()
-    lecturer = models.CharField(max_length=200)
+    lecturer = models.ForeignKey(
+        'Profile', on_delete=models.SET_NULL, null=True, blank=True, related_name='courses',
+        limit_choices_to={'role': 'lecturer'},
+    )
     students = models.ManyToManyField(Student, related_name='courses', blank=True)
+    term = models.ForeignKey(Term, on_delete=models.SET_NULL, null=True, blank=True, related_name='courses')
+    capacity = models.PositiveIntegerField(null=True, blank=True)  # None = no limit
+    seats_taken = models.PositiveIntegerField(default=0, editable=False)  # enrolled students, kept by sync_seats
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['code'], name='course_code_idx'),
+            models.Index(Lower('code'), name='course_code_lower_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        previous = None
+        if self.pk:
+            previous = Course.objects.filter(pk=self.pk).values('credit_units', 'capacity', 'term_id').first()
+        if previous is not None and 'update_fields' not in kwargs:
+            # seats_taken is written only by the enrollment engine and
+            # sync_seats; don't overwrite it with this instance's stale copy
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields if not f.primary_key and f.name != 'seats_taken'
+            ]
+        super().save(*args, **kwargs)
+
+        if previous is not None and (
+            previous['credit_units'] != int(self.credit_units) or previous['term_id'] != self.term_id
+        ):
+            self._regrade(previous)
+
+        # More seats: move students up from the waitlist
+        if previous is not None and previous['capacity'] != self.capacity:
+            from .enrollment import promote_waitlist
+            promote_waitlist(self.pk)
+
+    def _regrade(self, previous):
+        # Grades that followed the course's old term move with it. Stored
+        # GPAs weight this course by its old credit units, and closed-term
+        # snapshots by both; rebuild the ones of the course's students.
+        from .fragments import bump, student
+        from .utils import recalculate_gpa
+
+        with transaction.atomic():
+            grades = self.grade_set.all()
+            student_ids = list(grades.values_list('student_id', flat=True))
+            term_ids = set(grades.values_list('term_id', flat=True))
+            if previous['term_id'] != self.term_id:
+                grades.filter(term_id=previous['term_id']).update(term_id=self.term_id)
+                term_ids |= {previous['term_id'], self.term_id}
+            if previous['credit_units'] != int(self.credit_units):
+                recalculate_gpa(Student.objects.filter(pk__in=student_ids))
+            for term in Term.objects.filter(pk__in=term_ids, is_closed=True):
+                term.freeze(student_ids)
+        bump('grades', *[student(pk) for pk in student_ids])
 
-    
     def __str__(self):
         return f"{self.name} ({self.code})"
     
@@ -33,40 +207,61 @@ class Grade(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     score = models.IntegerField()
     letter = models.CharField(max_length=2, blank=True)  # new field
+    term = models.ForeignKey(Term, on_delete=models.SET_NULL, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'course'], name='unique_grade_per_course'),
+        ]
 
     def save(self, *args, **kwargs):
         if self.score is not None:
             self.score = int(self.score)
         self.letter = self.get_letter_grade()
-        super().save(*args, **kwargs)
+        if self.term_id is None:
+            self.term_id = self.course.term_id
+
+        with transaction.atomic():
+            previous = None
+            if self.pk:
+                previous = Grade.objects.filter(pk=self.pk).values(
+                    'student_id', 'course_id', 'score', 'letter', 'course__credit_units', 'term_id'
+                ).first()
+            super().save(*args, **kwargs)
+
+            # Keep Student.gpa / total_credits in step with this grade
+            units = self.course.credit_units
+            points = self.grade_point * units
+            if previous:
+                old_units = previous['course__credit_units']
+                old_points = LETTER_POINTS.get(previous['letter'], 0) * old_units
+                if previous['student_id'] == self.student_id:
+                    points, units = points - old_points, units - old_units
+                else:
+                    Student.adjust_gpa(previous['student_id'], -old_points, -old_units)
+            Student.adjust_gpa(self.student_id, points, units)
+
+            # And the course's CourseStats row
+            if not previous or (previous['course_id'], previous['score'], previous['letter']) != (
+                self.course_id, self.score, self.letter
+            ):
+                if previous:
+                    CourseStats.remove_grade(previous['course_id'], previous['score'], previous['letter'])
+                CourseStats.add_grade(self.course_id, self.score, self.letter)
+
+            # Late changes to a closed term re-freeze that term's snapshot
+            if previous:
+                TermGPA.refresh(previous['student_id'], previous['term_id'])
+            if not previous or (previous['student_id'], previous['term_id']) != (self.student_id, self.term_id):
+                TermGPA.refresh(self.student_id, self.term_id)
 
     def get_letter_grade(self):
-        try:
-            score = int(self.score)
-        except (TypeError, ValueError):
-            return 'F'
-        if score >= 70:
-            return 'A'
-        elif score >= 60:
-            return 'B'
-        elif score >= 50:
-            return 'C'
-        elif score >= 40:
-            return 'D'
-        else:
-            return 'F'
+        return letter_for_score(self.score)
 
     
     @property
     def grade_point(self):
-        LETTER_POINTS = {
-            'A': 5,
-            'B': 4,
-            'C': 3,
-            'D': 2,
-            'F': 0,
-        }
-        return LETTER_POINTS.get(self.letter, 0)   
+        return LETTER_POINTS.get(self.letter, 0)
 
     def __str__(self):
         return f"{self.student.name} - {self.course}: {self.score} ({self.letter})"
@@ -74,22 +269,209 @@ class Grade(models.Model):
     @property
     def np_status(self):
         # Normal Progress if grade is A-D
-        if self.letter in ['A', 'B', 'C', 'D']:
+        if self.letter in PASSING_LETTERS:
             return "NP"
         return "BNP"  # Not in Normal Progress
 
 
 
+class TermGPA(models.Model):
+    # GPA for one student in one closed term (see Term.close)
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='term_gpas')
+    term = models.ForeignKey(Term, on_delete=models.CASCADE, related_name='gpa_snapshots')
+    points = models.IntegerField(default=0)  # sum of grade point x credit units
+    credits = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'term'], name='unique_term_gpa'),
+        ]
+
+    def __str__(self):
+        return f"{self.student} - {self.term}: {self.gpa}"
+
+    @property
+    def gpa(self):
+        return round(self.points / self.credits, 2) if self.credits else 0
+
+    @classmethod
+    def refresh(cls, student_id, term_id):
+        # Recompute one student's snapshot if the term is already closed
+        if term_id is None or not Term.objects.filter(pk=term_id, is_closed=True).exists():
+            return
+        grades = Grade.objects.filter(student_id=student_id, term_id=term_id).values_list(
+            'letter', 'course__credit_units'
+        )
+        points = sum(LETTER_POINTS.get(letter, 0) * units for letter, units in grades)
+        credits = sum(units for _, units in grades)
+        if credits:
+            cls.objects.update_or_create(
+                student_id=student_id, term_id=term_id, defaults={'points': points, 'credits': credits}
+            )
+        else:
+            cls.objects.filter(student_id=student_id, term_id=term_id).delete()
+
+
 class CourseReview (models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='reviews')
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     rating = models.IntegerField(choices=[(i, str(i)) for i in range(1, 6)])
     comment = models.TextField(blank=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'course'], name='unique_review_per_course'),
+        ]
+
     def __str__(self):
         return f"{self.course.name} - {self.rating} by {self.student.name}"
 
 
+class CourseStats(models.Model):
+    """Per-course grade and review totals, kept up to date on every write.
+
+    Grade.save, CourseReview saves and deletes adjust the row with
+    single-UPDATE deltas (as Student.adjust_gpa does), so the dashboards
+    read one row per course instead of aggregating grades and reviews.
+    Bulk writes, which skip those hooks, call rebuild_course_stats. The
+    enrollment count is Course.seats_taken.
+    """
+
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    grade_count = models.IntegerField(default=0)
+    score_total = models.IntegerField(default=0)
+    count_a = models.IntegerField(default=0)
+    count_b = models.IntegerField(default=0)
+    count_c = models.IntegerField(default=0)
+    count_d = models.IntegerField(default=0)
+    count_f = models.IntegerField(default=0)
+    pass_count = models.IntegerField(default=0)  # grades with a PASSING_LETTERS letter
+    review_count = models.IntegerField(default=0)
+    rating_total = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"Stats for {self.course_id}"
+
+    @property
+    def avg_score(self):
+        return round(self.score_total / self.grade_count, 1) if self.grade_count else None
+
+    @property
+    def pass_rate(self):
+        # Percentage of grades in Normal Progress
+        return round(self.pass_count * 100 / self.grade_count, 1) if self.grade_count else None
+
+    @property
+    def avg_rating(self):
+        return round(self.rating_total / self.review_count, 1) if self.review_count else None
+
+    @property
+    def letter_distribution(self):
+        return {letter: getattr(self, f'count_{letter.lower()}') for letter in LETTER_POINTS}
+
+    @classmethod
+    def _adjust(cls, course_id, **deltas):
+        # Apply `deltas` to the course's row in one UPDATE; a missing row is
+        # rebuilt from scratch instead (it then already includes this write)
+        updated = cls.objects.filter(pk=course_id).update(
+            **{field: F(field) + delta for field, delta in deltas.items() if delta}
+        )
+        if not updated:
+            rebuild_course_stats([course_id])
+
+    @classmethod
+    def _grade_deltas(cls, sign, score, letter):
+        deltas = {'grade_count': sign, 'score_total': sign * (score or 0)}
+        if letter in LETTER_POINTS:
+            deltas[f'count_{letter.lower()}'] = sign
+        if letter in PASSING_LETTERS:
+            deltas['pass_count'] = sign
+        return deltas
+
+    @classmethod
+    def add_grade(cls, course_id, score, letter):
+        cls._adjust(course_id, **cls._grade_deltas(1, score, letter))
+
+    @classmethod
+    def remove_grade(cls, course_id, score, letter):
+        cls._adjust(course_id, **cls._grade_deltas(-1, score, letter))
+
+    @classmethod
+    def add_review(cls, course_id, rating, sign=1):
+        cls._adjust(course_id, review_count=sign, rating_total=sign * rating)
+
+
+def rebuild_course_stats(course_ids=None):
+    """Recompute CourseStats for these courses (default all) from Grade and
+    CourseReview, in two grouped queries and one upsert. Returns the number
+    of rows written."""
+    courses = Course.objects.all() if course_ids is None else Course.objects.filter(pk__in=course_ids)
+    rows = {pk: CourseStats(course_id=pk) for pk in courses.values_list('pk', flat=True)}
+
+    grades = Grade.objects.filter(course__in=courses).values('course_id').annotate(
+        grade_count=Count('id'),
+        score_total=Coalesce(Sum('score'), 0),
+        pass_count=Count('id', filter=Q(letter__in=PASSING_LETTERS)),
+        **{f'count_{letter.lower()}': Count('id', filter=Q(letter=letter)) for letter in LETTER_POINTS},
+    )
+    reviews = CourseReview.objects.filter(course__in=courses).values('course_id').annotate(
+        review_count=Count('id'), rating_total=Coalesce(Sum('rating'), 0),
+    )
+    for totals in [*grades, *reviews]:
+        row = rows[totals.pop('course_id')]
+        for field, value in totals.items():
+            setattr(row, field, value)
+
+    fields = [f.name for f in CourseStats._meta.concrete_fields if not f.primary_key]
+    CourseStats.objects.bulk_create(
+        rows.values(), update_conflicts=True, unique_fields=['course'], update_fields=fields, batch_size=1000,
+    )
+    from .fragments import bump
+    bump('grades', 'reviews')
+    return len(rows)
+
+
+class WaitlistEntry(models.Model):
+    # A student waiting for a seat in a full course; served in id order
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='waitlist')
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='waitlist_entries')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['course', 'student'], name='unique_waitlist_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['course', 'id'], name='waitlist_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.student.name} waiting for {self.course.name}"
+
+
+class ExportJob(models.Model):
+    # A CSV export run in the background; the file lands under MEDIA_ROOT
+    PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    kind = models.CharField(max_length=50)  # a key of exports.EXPORTS
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    file = models.FileField(upload_to='exports/', blank=True)
+    row_count = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'created_at'], name='exportjob_kind_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} export #{self.pk} ({self.status})"
+
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     role = models.CharField(max_length=20, choices=[
@@ -97,10 +479,14 @@ class Profile(models.Model):
        ("lecturer", "Lecturer"),
        ("admin", "Admin"), 
     ])
-    courses = models.ManyToManyField('Course', blank=True, related_name='lecturer_profiles')
     name = models.CharField(max_length=100)
     student = models.OneToOneField(Student, null=True, blank=True, on_delete=models.SET_NULL)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['role'], name='profile_role_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.role})"
     
@@ -110,3 +496,85 @@ def create_or_update_user_profile(sender, instance, created, **kwargs):
     if created:
         Profile.objects.create(user=instance, name=instance.username)
 
+
+# A deleted export job takes its file with it, once the delete has committed
+@receiver(post_delete, sender=ExportJob)
+def delete_export_file(sender, instance, **kwargs):
+    if instance.file:
+        storage, name = instance.file.storage, instance.file.name
+        transaction.on_commit(lambda: storage.delete(name))
+
+
+# Take a deleted grade (including cascades from Course/Student) out of the stored GPA
+@receiver(post_delete, sender=Grade)
+def remove_grade_from_gpa(sender, instance, **kwargs):
+    units = Course.objects.filter(pk=instance.course_id).values_list('credit_units', flat=True).first()
+    if units:
+        Student.adjust_gpa(instance.student_id, -instance.grade_point * units, -units)
+    TermGPA.refresh(instance.student_id, instance.term_id)
+    # The course's stats row is gone too when the course itself is deleted
+    if CourseStats.objects.filter(pk=instance.course_id).exists():
+        CourseStats.remove_grade(instance.course_id, instance.score, instance.letter)
+
+
+# Every course gets a CourseStats row
+@receiver(post_save, sender=Course)
+def create_course_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        CourseStats.objects.get_or_create(course=instance)
+
+
+# Keep CourseStats' review totals in step; an edit may change the rating
+@receiver(pre_save, sender=CourseReview)
+def remember_review(sender, instance, raw=False, **kwargs):
+    instance._previous_review = None
+    if instance.pk and not raw:
+        instance._previous_review = CourseReview.objects.filter(pk=instance.pk).values('course_id', 'rating').first()
+
+
+@receiver(post_save, sender=CourseReview)
+def count_review(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_review', None)
+    if previous:
+        CourseStats.add_review(previous['course_id'], previous['rating'], sign=-1)
+    CourseStats.add_review(instance.course_id, instance.rating)
+
+
+@receiver(post_delete, sender=CourseReview)
+def uncount_review(sender, instance, **kwargs):
+    if CourseStats.objects.filter(pk=instance.course_id).exists():
+        CourseStats.add_review(instance.course_id, instance.rating, sign=-1)
+
+
+def sync_seats(course_ids):
+    # Recount Course.seats_taken from the through table for these courses
+    Course.objects.filter(pk__in=course_ids).update(seats_taken=enrollment_count_expression())
+
+
+# Keep seats_taken right however enrollments change (admin, imports, add/remove)
+@receiver(m2m_changed, sender=Course.students.through)
+def update_seats_taken(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._cleared_course_ids = list(instance.courses.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        sync_seats(pk_set if reverse else [instance.pk])
+    elif action == 'post_clear':
+        sync_seats(getattr(instance, '_cleared_course_ids', []) if reverse else [instance.pk])
+
+
+# Deleting a student drops their enrollments without an m2m_changed signal
+@receiver(pre_delete, sender=Student)
+def remember_student_courses(sender, instance, **kwargs):
+    instance._enrolled_course_ids = list(instance.courses.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Student)
+def release_student_seats(sender, instance, **kwargs):
+    course_ids = getattr(instance, '_enrolled_course_ids', [])
+    if course_ids:
+        sync_seats(course_ids)
+        from .enrollment import promote_waitlist
+        for course_id in course_ids:
+            promote_waitlist(course_id)
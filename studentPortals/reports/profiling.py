@@ -0,0 +1,213 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger('reports.queries')
+
+# Query-budget profiling for the views in reports.urls. Each request's
+# queries are counted and timed through a connection execute wrapper and
+# grouped by fingerprint: the SQL with literals and IN-lists normalised, so
+# queries that differ only in their parameters fall together. A fingerprint
+# seen REPORTS_QUERY_REPEAT_THRESHOLD or more times in one request is
+# flagged as a likely N+1.
+
+DEFAULT_BUDGET = 20
+DEFAULT_REPEAT_THRESHOLD = 5
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN \((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+_SPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """`sql` with its parameters and literals replaced by `?`."""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+class QueryProfile:
+    """The queries run while it was recording: count, time and fingerprints."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    @property
+    def milliseconds(self):
+        return self.seconds * 1000
+
+    def repeated(self, threshold=None):
+        """[(fingerprint, times)] run at least `threshold` times, most first."""
+        if threshold is None:
+            threshold = repeat_threshold()
+        return [(sql, n) for sql, n in self.fingerprints.most_common() if n >= threshold]
+
+    def report(self):
+        lines = [f"{self.count} queries in {self.milliseconds:.1f} ms"]
+        lines += [f"  {n}x {sql}" for sql, n in self.repeated()]
+        return '\n'.join(lines)
+
+
+def budget_for(view_name):
+    budgets = getattr(settings, 'REPORTS_QUERY_BUDGETS', {})
+    return budgets.get(view_name, getattr(settings, 'REPORTS_QUERY_BUDGET', DEFAULT_BUDGET))
+
+
+def repeat_threshold():
+    return getattr(settings, 'REPORTS_QUERY_REPEAT_THRESHOLD', DEFAULT_REPEAT_THRESHOLD)
+
+
+@contextmanager
+def profile_queries(using=DEFAULT_DB_ALIAS):
+    """Record the queries run inside the block; yields a QueryProfile."""
+    profile = QueryProfile()
+    with connections[using].execute_wrapper(profile):
+        yield profile
+
+
+@contextmanager
+def query_budget(max_queries, allow_repeats=False):
+    """Test helper: fail if the block runs more than `max_queries` queries,
+    or (unless `allow_repeats`) repeats one query past the N+1 threshold.
+
+        with query_budget(6):
+            client.get(reverse('admin_dashboard'))
+    """
+    with profile_queries() as profile:
+        yield profile
+    if profile.count > max_queries:
+        raise AssertionError(f"Query budget of {max_queries} exceeded: {profile.report()}")
+    if not allow_repeats and profile.repeated():
+        raise AssertionError(f"Repeated queries (likely N+1): {profile.report()}")
+
+
+class ViewStats:
+    """Totals for one view across the requests profiled so far."""
+
+    SAMPLES = 5
+
+    def __init__(self, view_name, budget):
+        self.view_name = view_name
+        self.budget = budget
+        self.requests = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.seconds = 0.0
+        self.over_budget = 0
+        self.repeated = {}  # fingerprint -> most times seen in one request
+
+    def add(self, profile):
+        self.requests += 1
+        self.queries += profile.count
+        self.max_queries = max(self.max_queries, profile.count)
+        self.seconds += profile.seconds
+        if profile.count > self.budget:
+            self.over_budget += 1
+        for sql, n in profile.repeated():
+            if n > self.repeated.get(sql, 0):
+                self.repeated[sql] = n
+
+    @property
+    def avg_queries(self):
+        return self.queries / self.requests if self.requests else 0
+
+    @property
+    def avg_ms(self):
+        return self.seconds * 1000 / self.requests if self.requests else 0
+
+    @property
+    def top_repeated(self):
+        return sorted(self.repeated.items(), key=lambda item: -item[1])[:self.SAMPLES]
+
+
+# Per-process totals shown on the admin query profile page
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def view_stats():
+    """ViewStats for every profiled view, the heaviest first."""
+    with _stats_lock:
+        return sorted(_stats.values(), key=lambda s: (-s.max_queries, s.view_name))
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def _record(view_name, profile):
+    budget = budget_for(view_name)
+    with _stats_lock:
+        stats = _stats.get(view_name)
+        if stats is None:
+            stats = _stats[view_name] = ViewStats(view_name, budget)
+        stats.add(profile)
+    if profile.count > budget:
+        logger.warning("%s ran %d queries (budget %d) in %.1f ms", view_name, profile.count, budget, profile.milliseconds)
+    for sql, n in profile.repeated():
+        logger.warning("%s repeated a query %d times (likely N+1): %s", view_name, n, sql)
+
+
+_reports_views = None
+
+
+def _is_reports_view(func):
+    global _reports_views
+    if _reports_views is None:
+        from . import urls
+        _reports_views = {pattern.callback for pattern in urls.urlpatterns}
+    return func in _reports_views
+
+
+class QueryBudgetMiddleware:
+    """Profile the queries of every request served by a reports view.
+
+    Views over their budget (REPORTS_QUERY_BUDGET, or REPORTS_QUERY_BUDGETS
+    by URL name) and repeated queries are logged to `reports.queries` and
+    counted for the admin query profile page. With DEBUG on the numbers are
+    also sent as X-Query-Count, X-Query-Time-Ms and X-Query-Repeated headers.
+    Off unless REPORTS_QUERY_PROFILING is set.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'REPORTS_QUERY_PROFILING', False):
+            return self.get_response(request)
+
+        with profile_queries() as profile:
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        if match is None or not _is_reports_view(match.func):
+            return response
+        # Streaming responses run their queries after this returns; only the
+        # view's own queries are counted for them
+        _record(match.view_name, profile)
+        if settings.DEBUG:
+            response['X-Query-Count'] = str(profile.count)
+            response['X-Query-Time-Ms'] = f'{profile.milliseconds:.1f}'
+            response['X-Query-Repeated'] = str(len(profile.repeated()))
+        return response
@@ -0,0 +1,177 @@
+import re
+
+from django.db import connections
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from .models import Course
+
+# Course search over name, code and lecturer name. On SQLite with FTS5 the
+# words are matched as prefixes against a full-text index kept in step with
+# reports_course / reports_profile by triggers, and ranked by bm25. Other
+# databases fall back to prefix (istartswith) matching ranked by field.
+
+FTS_TABLE = 'reports_course_fts'
+# bm25 weights for the name, code and lecturer columns
+FTS_WEIGHTS = (10.0, 5.0, 2.0)
+PAGE_SIZE = 20
+# Shorter words match too much of the catalog to be worth ranking; a query
+# made only of them still filters, by plain prefix matching
+MIN_WORD_LENGTH = 2
+
+_LECTURER_NAME = '(SELECT name FROM reports_profile WHERE id = new.lecturer_id)'
+
+_FTS_TRIGGERS = ['insert', 'update', 'delete', 'lecturer']
+
+_FTS_SQL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(name, code, lecturer, prefix='2 3')",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_insert",
+    f"""CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON reports_course BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, code, lecturer) VALUES (new.id, new.name, new.code, {_LECTURER_NAME});
+    END""",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_update",
+    f"""CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE ON reports_course BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        INSERT INTO {FTS_TABLE}(rowid, name, code, lecturer) VALUES (new.id, new.name, new.code, {_LECTURER_NAME});
+    END""",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_delete",
+    f"""CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON reports_course BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END""",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_lecturer",
+    f"""CREATE TRIGGER {FTS_TABLE}_lecturer AFTER UPDATE OF name ON reports_profile BEGIN
+        UPDATE {FTS_TABLE} SET lecturer = new.name
+        WHERE rowid IN (SELECT id FROM reports_course WHERE lecturer_id = new.id);
+    END""",
+    # Resync in case courses changed while the triggers were missing
+    f"DELETE FROM {FTS_TABLE}",
+    f"""INSERT INTO {FTS_TABLE}(rowid, name, code, lecturer)
+        SELECT c.id, c.name, c.code, p.name FROM reports_course c
+        LEFT JOIN reports_profile p ON p.id = c.lecturer_id""",
+]
+
+
+# Database aliases known to have the FTS5 index, so it is checked for once
+_fts_ready = set()
+
+
+def fts_available(using='default'):
+    if using in _fts_ready:
+        return True
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        if cursor.fetchone() is None:
+            return False
+    _fts_ready.add(using)
+    return True
+
+
+def install_course_search(using='default', **kwargs):
+    """Create (or re-create) the FTS5 index and its triggers, then refill it.
+
+    Runs after every migrate (see uninstall_course_search). Does nothing
+    off SQLite, without FTS5, or when migrated back to before
+    Course.lecturer became a foreign key.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        if not cursor.fetchone()[0]:
+            return
+        if Course._meta.db_table not in connection.introspection.table_names(cursor):
+            return
+        columns = {column.name for column in connection.introspection.get_table_description(cursor, Course._meta.db_table)}
+        if 'lecturer_id' not in columns:
+            return
+        for sql in _FTS_SQL:
+            cursor.execute(sql)
+
+
+def uninstall_course_search(using='default', **kwargs):
+    # Runs before every migrate: SQLite alters a table by rebuilding and
+    # renaming it, which fails while a trigger on another table refers to it
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name in _FTS_TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{name}")
+
+
+def _words(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def _fts_ids(words, queryset, limit, offset):
+    # Every word must match as a prefix somewhere; quoting keeps FTS5
+    # operators in user input literal. The unary + stops SQLite handing the
+    # candidate filter to FTS5 as one index probe per course.
+    match = ' '.join('"%s"*' % word.replace('"', '""') for word in words)
+    candidates, params = queryset.values('pk').query.sql_with_params()
+    sql = (
+        f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND +rowid IN ({candidates}) "
+        f"ORDER BY bm25({FTS_TABLE}, {', '.join(map(str, FTS_WEIGHTS))}), rowid LIMIT %s OFFSET %s"
+    )
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, [match, *params, limit, offset])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _prefix_ids(words, queryset, limit, offset):
+    rank = Value(0)
+    for word in words:
+        queryset = queryset.filter(
+            Q(name__istartswith=word) | Q(code__istartswith=word) | Q(lecturer__name__istartswith=word)
+        )
+        rank = rank + Case(
+            When(name__istartswith=word, then=Value(3)),
+            When(code__istartswith=word, then=Value(2)),
+            default=Value(1),
+            output_field=IntegerField(),
+        )
+    ranked = queryset.annotate(search_rank=rank).order_by('-search_rank', 'pk')
+    return list(ranked.values_list('pk', flat=True)[offset:offset + limit])
+
+
+def _page_number(value):
+    try:
+        return max(int(value), 1)
+    except (TypeError, ValueError):
+        return 1
+
+
+def search_courses(query, request, queryset=None, per_page=PAGE_SIZE):
+    """One page of courses matching `query`, best matches first.
+
+    `queryset` limits the candidates (default all courses). Reads ?page=<n>
+    from the request and returns {'items', 'number', 'has_next',
+    'has_prev'}. Each page costs two queries whatever the catalog size;
+    no COUNT is taken.
+    """
+    if queryset is None:
+        queryset = Course.objects.all()
+    number = _page_number(request.GET.get('page'))
+    offset = (number - 1) * per_page
+
+    words = _words(query)
+    long_words = [word for word in words if len(word) >= MIN_WORD_LENGTH]
+    if not words:
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True)[offset:offset + per_page + 1])
+    elif long_words and fts_available(queryset.db):
+        ids = _fts_ids(long_words, queryset, per_page + 1, offset)
+    else:
+        ids = _prefix_ids(long_words or words, queryset, per_page + 1, offset)
+
+    has_next = len(ids) > per_page
+    ids = ids[:per_page]
+    courses = Course.objects.select_related('lecturer').in_bulk(ids)
+    return {
+        'items': [courses[pk] for pk in ids if pk in courses],
+        'number': number,
+        'has_next': has_next,
+        'has_prev': number > 1,
+    }
@@ -1,9 +1,1077 @@
-<<<<<<< HEAD
-from django.test import TestCase
-
-# Create your tests here.
-=======
-from django.test import TestCase
-
-# Create your tests here.
->>>>>>> bbc56343274ba21683d99fc68ba04072d741c2ff
+import csv
+import datetime
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models.functions import Lower
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import grading
+from . import enrollment
+from . import urls as report_urls
+from .export_jobs import delete_expired_exports, submit_export
+from .exports import EXPORTS, SUMMARY_CACHE_KEY, summary_counts
+from .fragments import fragment_versions, student as student_version
+from .models import (
+    LETTER_POINTS, Course, CourseReview, CourseStats, ExportJob, Grade, Profile, Student, Term, TermGPA,
+    WaitlistEntry, letter_for_score, rebuild_course_stats,
+)
+from .profiling import fingerprint, profile_queries, reset_stats, view_stats
+from .search import fts_available, install_course_search, search_courses, uninstall_course_search
+from .utils import (
+    PAGE_SIZE, annotate_gpa, course_roster, gpa_summary, keyset_page, recalculate_gpa, roster_entries,
+    save_course_grades, top_students,
+)
+
+
+def make_user(username, role, student=None):
+    # A login whose Profile (created by the User post_save) has `role`
+    user = User.objects.create_user(username, password='pw')
+    Profile.objects.filter(user=user).update(role=role, student=student)
+    return user
+
+
+class GenerateDatasetTests(TestCase):
+    OPTIONS = {
+        'students': 8, 'courses': 3, 'grades': 12, 'reviews': 5, 'lecturers': 2, 'terms': 2, 'batch_size': 5,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('generate_dataset', **cls.OPTIONS, stdout=StringIO())
+
+    def test_counts(self):
+        self.assertEqual(Student.objects.count(), 8)
+        self.assertEqual(Course.objects.count(), 3)
+        self.assertEqual(Grade.objects.count(), 12)
+        self.assertEqual(Course.students.through.objects.count(), 12)
+        self.assertEqual(CourseReview.objects.count(), 5)
+        self.assertEqual(Profile.objects.filter(role='lecturer').count(), 2)
+
+    def test_derived_data_is_consistent(self):
+        # Everything bulk_create skips has been rebuilt
+        for grade in Grade.objects.all():
+            self.assertEqual(grade.letter, letter_for_score(grade.score))
+        for course in Course.objects.all():
+            self.assertEqual(course.seats_taken, course.students.count())
+        for student in annotate_gpa():
+            self.assertAlmostEqual(student.gpa, student.gpa_value)
+        stats = list(CourseStats.objects.order_by('pk').values())
+        rebuild_course_stats()
+        self.assertEqual(list(CourseStats.objects.order_by('pk').values()), stats)
+
+    def test_refuses_to_run_twice(self):
+        with self.assertRaises(CommandError):
+            call_command('generate_dataset', **self.OPTIONS, stdout=StringIO())
+
+
+class BenchmarkReportsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # What benchmark_reports picks: a course with a lecturer login, an
+        # admin, and a student login with its own Student
+        make_user('admin', 'admin')
+        lecturer = make_user('lecturer', 'lecturer').profile
+        ann = Student.objects.create(name='Ann', email='ann@example.com')
+        bob = Student.objects.create(name='Bob', email='bob@example.com')
+        make_user('ann', 'student', student=ann)
+        maths = Course.objects.create(name='Maths', code='MAT1', credit_units=4, lecturer=lecturer)
+        art = Course.objects.create(name='Art', code='ART1', credit_units=2, lecturer=lecturer)
+        maths.students.add(ann, bob)
+        art.students.add(ann)
+        Grade.objects.create(student=ann, course=maths, score=72)
+        Grade.objects.create(student=bob, course=maths, score=48)
+        CourseReview.objects.create(student=ann, course=maths, rating=4, comment='Good')
+
+    def test_writes_results(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'results.json')
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('benchmark_reports', repeat=2, output=path, stdout=StringIO(), stderr=StringIO())
+            with open(path, encoding='utf-8') as f:
+                output = json.load(f)
+
+        self.assertEqual(output['dataset']['grades'], 2)
+        results = {r['name']: r for r in output['results']}
+        self.assertIn('utils:recalculate_gpa', results)
+        for name, result in results.items():
+            self.assertIsNone(result['error'], name)
+            self.assertEqual(result['runs'], 2)
+            self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+
+        # Every named reports URL is either timed or skipped with a reason
+        timed = {name.split(':', 1)[1] for name in results if not name.startswith('utils:')}
+        url_names = {pattern.name for pattern in report_urls.urlpatterns if pattern.name}
+        self.assertEqual(url_names - timed, set(output['skipped']))
+        self.assertFalse(timed & set(output['skipped']))
+        self.assertFalse(ExportJob.objects.exists())
+
+    def test_rolls_back_writes(self):
+        gpas = list(Student.objects.order_by('pk').values_list('gpa', flat=True))
+        call_command('benchmark_reports', repeat=1, only='utils:save_course_grades',
+                     output=os.devnull, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(list(Student.objects.order_by('pk').values_list('gpa', flat=True)), gpas)
+
+
+class QueryProfilingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = make_user('admin', 'admin')
+        for i in range(3):
+            Student.objects.create(name=f'Student {i}', email=f's{i}@example.com')
+
+    def setUp(self):
+        reset_stats()
+        self.addCleanup(reset_stats)
+        self.client.force_login(self.admin)
+
+    def test_fingerprint_ignores_literals_and_in_list_length(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id = 5 AND name = 'O''Brien' AND score > 2.5"),
+            "SELECT * FROM t WHERE id = ? AND name = ? AND score > ?",
+        )
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s)'),
+            fingerprint('SELECT  *\n FROM t WHERE id IN (%s)'),
+        )
+        self.assertEqual(fingerprint('SELECT * FROM t WHERE id IN (1, 2)'), 'SELECT * FROM t WHERE id IN (...)')
+        self.assertNotEqual(fingerprint('SELECT * FROM t WHERE id = 1'), fingerprint('SELECT * FROM u WHERE id = 1'))
+
+    def test_middleware_records_each_view(self):
+        url = reverse('admin_students')
+        with self.settings(REPORTS_QUERY_PROFILING=True, DEBUG=True):
+            counts = [int(self.client.get(url)['X-Query-Count']) for _ in range(2)]
+        [stats] = view_stats()
+        self.assertEqual((stats.view_name, stats.requests), ('admin_students', 2))
+        self.assertEqual((stats.queries, stats.max_queries), (sum(counts), max(counts)))
+        self.assertEqual(stats.over_budget, 0)
+
+    def test_over_budget_and_repeated_queries_are_logged(self):
+        with self.settings(REPORTS_QUERY_PROFILING=True, REPORTS_QUERY_BUDGETS={'admin_students': 1}):
+            with self.assertLogs('reports.queries', 'WARNING') as logs:
+                self.client.get(reverse('admin_students'))
+        self.assertRegex(logs.output[0], r'admin_students ran \d+ queries \(budget 1\)')
+        self.assertEqual(view_stats()[0].over_budget, 1)
+
+        with self.settings(REPORTS_QUERY_PROFILING=True, REPORTS_QUERY_REPEAT_THRESHOLD=1):
+            with self.assertLogs('reports.queries', 'WARNING') as logs:
+                self.client.get(reverse('admin_students'))
+        self.assertIn('repeated a query 1 times (likely N+1)', logs.output[0])
+
+    def test_within_budget_is_quiet(self):
+        with self.settings(REPORTS_QUERY_PROFILING=True):
+            with self.assertNoLogs('reports.queries', 'WARNING'):
+                response = self.client.get(reverse('admin_students'))
+        self.assertNotIn('X-Query-Count', response)  # DEBUG is off
+
+    def test_off_unless_enabled(self):
+        with self.settings(REPORTS_QUERY_PROFILING=False):
+            self.client.get(reverse('admin_students'))
+        self.assertEqual(view_stats(), [])
+
+
+class FragmentCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = make_user('admin', 'admin')
+        ann = Student.objects.create(name='Ann', email='ann@example.com')
+        bob = Student.objects.create(name='Bob', email='bob@example.com')
+        for i, score in enumerate([81, 57, 39]):
+            course = Course.objects.create(name=f'Course {i}', code=f'C{i}', credit_units=3)
+            Grade.objects.create(student=ann, course=course, score=score)
+        Grade.objects.create(student=bob, course=course, score=64)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def test_cached_blocks_skip_queries(self):
+        url = reverse('admin_dashboard')
+        with profile_queries() as first:
+            self.client.get(url)
+        with profile_queries() as second:
+            response = self.client.get(url)
+        self.assertLess(second.count, first.count)
+        self.assertContains(response, str(Grade.objects.count()))
+
+    def test_write_invalidates_dependent_blocks(self):
+        url = reverse('admin_dashboard')
+        self.client.get(url)
+        course = Course.objects.order_by('-id').first()  # listed under Recent Courses
+        with self.captureOnCommitCallbacks(execute=True):
+            course.name = 'Renamed course'
+            course.save()
+        self.assertContains(self.client.get(url), 'Renamed course')
+        with self.captureOnCommitCallbacks(execute=True):
+            Grade.objects.filter(pk=Grade.objects.order_by('pk').first().pk).delete()
+        self.assertContains(self.client.get(url), f'<div class="stat">{Grade.objects.count()}</div>')
+
+    def test_rolled_back_write_bumps_nothing(self):
+        versions = fragment_versions({'courses': ['courses']})
+        try:
+            with transaction.atomic():
+                Course.objects.order_by('pk').first().save()
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(fragment_versions({'courses': ['courses']}), versions)
+
+
+class CourseStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ann = Student.objects.create(name='Ann', email='ann@example.com')
+        cls.bob = Student.objects.create(name='Bob', email='bob@example.com')
+        cls.cat = Student.objects.create(name='Cat', email='cat@example.com')
+        cls.maths = Course.objects.create(name='Maths', code='MAT1', credit_units=4)
+        cls.art = Course.objects.create(name='Art', code='ART1', credit_units=2)
+        cls.logic = Course.objects.create(name='Logic', code='LOG1', credit_units=3)
+        cls.grade = Grade.objects.create(student=cls.ann, course=cls.maths, score=75)  # A
+        Grade.objects.create(student=cls.bob, course=cls.maths, score=35)  # F
+        Grade.objects.create(student=cls.ann, course=cls.art, score=55)  # C
+        cls.review = CourseReview.objects.create(student=cls.ann, course=cls.maths, rating=4)
+        CourseReview.objects.create(student=cls.bob, course=cls.maths, rating=2)
+
+    def snapshot(self):
+        return {
+            stats.pk: (stats.grade_count, stats.score_total, stats.letter_distribution, stats.pass_count,
+                       stats.review_count, stats.rating_total)
+            for stats in CourseStats.objects.all()
+        }
+
+    def assertMatchesRebuild(self):
+        incremental = self.snapshot()
+        rebuild_course_stats()
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_every_course_has_stats(self):
+        stats = self.snapshot()
+        self.assertEqual(stats[self.maths.pk], (2, 110, {'A': 1, 'B': 0, 'C': 0, 'D': 0, 'F': 1}, 1, 2, 6))
+        self.assertEqual(stats[self.logic.pk], (0, 0, {'A': 0, 'B': 0, 'C': 0, 'D': 0, 'F': 0}, 0, 0, 0))
+        self.assertMatchesRebuild()
+
+    def test_grade_writes_adjust_stats(self):
+        self.grade.score = 25
+        self.grade.save()
+        self.grade.course = self.logic
+        self.grade.save()
+        Grade.objects.get(student=self.bob).delete()
+        Grade.objects.create(student=self.cat, course=self.logic, score=45)
+        self.assertEqual(self.snapshot()[self.logic.pk][:2], (2, 70))
+        self.assertMatchesRebuild()
+
+    def test_review_writes_adjust_stats(self):
+        self.review.rating = 1
+        self.review.save()
+        CourseReview.objects.get(student=self.bob).delete()
+        self.assertEqual(self.snapshot()[self.maths.pk][4:], (1, 1))
+        self.assertMatchesRebuild()
+
+    def test_rates(self):
+        stats = CourseStats(grade_count=4, score_total=250, pass_count=3, review_count=2, rating_total=7)
+        self.assertEqual((stats.avg_score, stats.pass_rate, stats.avg_rating), (62.5, 75.0, 3.5))
+        self.assertIsNone(CourseStats().pass_rate)
+
+
+class GradingRulesTests(TestCase):
+    SCORES = list(range(-5, 106))
+
+    def test_bulk_helper_matches_python(self):
+        for scores in [self.SCORES, [None, '72', '', 'x', 69.9], []]:
+            self.assertEqual(grading.letters_for_scores(scores), [letter_for_score(score) for score in scores])
+
+
+class StoredGpaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ann = Student.objects.create(name='Ann', email='ann@example.com')
+        cls.bob = Student.objects.create(name='Bob', email='bob@example.com')
+        cls.maths = Course.objects.create(name='Maths', code='MAT1', credit_units=4)
+        cls.art = Course.objects.create(name='Art', code='ART1', credit_units=2)
+
+    def stored(self, student):
+        student.refresh_from_db()
+        return round(student.gpa, 4), student.total_credits
+
+    def test_grade_writes_apply_deltas(self):
+        grade = Grade.objects.create(student=self.ann, course=self.maths, score=75)  # A: 5 x 4
+        Grade.objects.create(student=self.ann, course=self.art, score=55)  # C: 3 x 2
+        self.assertEqual(self.stored(self.ann), (round(26 / 6, 4), 6))
+
+        grade.score = 45  # D: 2 x 4
+        grade.save()
+        self.assertEqual(self.stored(self.ann), (round(14 / 6, 4), 6))
+
+        grade.student = self.bob
+        grade.save()
+        self.assertEqual(self.stored(self.ann), (3.0, 2))
+        self.assertEqual(self.stored(self.bob), (2.0, 4))
+
+        grade.delete()
+        self.assertEqual(self.stored(self.bob), (0.0, 0))
+
+    def test_credit_change_and_cascade_rebuild(self):
+        Grade.objects.create(student=self.ann, course=self.maths, score=75)
+        Grade.objects.create(student=self.ann, course=self.art, score=30)  # F
+        self.art.credit_units = 6
+        self.art.save()
+        self.assertEqual(self.stored(self.ann), (2.0, 10))
+        self.art.delete()
+        self.assertEqual(self.stored(self.ann), (5.0, 4))
+
+    def test_matches_recalculation(self):
+        for score, student, course in [(90, self.ann, self.maths), (62, self.ann, self.art), (41, self.bob, self.art)]:
+            Grade.objects.create(student=student, course=course, score=score)
+        stored = [self.stored(self.ann), self.stored(self.bob)]
+        Student.objects.update(gpa=0, total_credits=0)
+        recalculate_gpa()
+        self.assertEqual([self.stored(self.ann), self.stored(self.bob)], stored)
+
+
+class MigrationTestCase(TransactionTestCase):
+    # Runs the reports migrations back and forth; the app is left on its
+    # latest migration afterwards
+
+    def migrate(self, target):
+        uninstall_course_search()  # as the migrate command's pre_migrate does
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([('reports', target)])
+        return executor.loader.project_state([('reports', target)]).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes('reports')[0][1])
+        install_course_search()
+
+
+class GpaMigrationTests(MigrationTestCase):
+    # 0008 and 0010 rebuild the stored GPA that Grade.save only adjusts
+
+    def test_existing_grades_are_counted(self):
+        apps = self.migrate('0007_profile_courses')
+        Student = apps.get_model('reports', 'Student')
+        Course = apps.get_model('reports', 'Course')
+        Grade = apps.get_model('reports', 'Grade')
+        student = Student.objects.create(name='Ann', email='ann@example.com')
+        maths = Course.objects.create(name='Maths', code='MAT1', credit_units=4, lecturer='')
+        art = Course.objects.create(name='Art', code='ART1', credit_units=2, lecturer='')
+        Grade.objects.create(student=student, course=maths, score=75, letter='A')
+        Grade.objects.create(student=student, course=art, score=55, letter='C')
+
+        apps = self.migrate('0009_term')
+        student = apps.get_model('reports', 'Student').objects.get()
+        self.assertEqual((round(student.gpa, 4), student.total_credits), (round(26 / 6, 4), 6))
+
+        # A duplicate that 0010 deletes, but which the stored GPA counted
+        apps.get_model('reports', 'Grade').objects.create(student_id=student.pk, course_id=art.pk, score=30, letter='F')
+        apps.get_model('reports', 'Student').objects.filter(pk=student.pk).update(gpa=20 / 8, total_credits=8)
+        apps = self.migrate('0010_unique_grade_per_course')
+        student = apps.get_model('reports', 'Student').objects.get()
+        self.assertEqual((student.gpa, student.total_credits), (20 / 6, 6))
+
+
+class LecturerMigrationTests(MigrationTestCase):
+    # 0012 turns the free-text Course.lecturer into a Profile foreign key
+
+    def test_lecturers_are_linked_by_name_or_username(self):
+        apps = self.migrate('0011_lookup_indexes')
+        User = apps.get_model('auth', 'User')
+        Profile = apps.get_model('reports', 'Profile')
+        Course = apps.get_model('reports', 'Course')
+
+        def profile(username, name, role):
+            return Profile.objects.create(user=User.objects.create(username=username), name=name, role=role)
+
+        # A student with a lecturer's name, created first, must not be picked
+        profile('lee-student', 'Dr Lee', 'student')
+        lee = profile('lee', 'Dr Lee', 'lecturer')
+        profile('lee-admin', 'Dr Lee', 'admin')
+        jdoe = profile('jdoe', 'John Doe', 'lecturer')
+        profile('ann', 'Ann', 'student')
+        courses = {
+            code: Course.objects.create(name=code, code=code, credit_units=3, lecturer=lecturer).pk
+            for code, lecturer in [('BY_NAME', ' dr lee '), ('BY_USERNAME', 'JDOE'), ('STUDENT', 'Ann'), ('NOBODY', 'Dr Who')]
+        }
+
+        apps = self.migrate('0012_course_lecturer_fk')
+        linked = dict(apps.get_model('reports', 'Course').objects.values_list('pk', 'lecturer_id'))
+        self.assertEqual(linked[courses['BY_NAME']], lee.pk)
+        self.assertEqual(linked[courses['BY_USERNAME']], jdoe.pk)
+        self.assertIsNone(linked[courses['STUDENT']])
+        self.assertIsNone(linked[courses['NOBODY']])
+
+
+class AdminStudentsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = make_user('admin', 'admin')
+        courses = [Course.objects.create(name=f'Course {i}', code=f'C{i}', credit_units=3) for i in range(3)]
+        for i in range(60):
+            student = Student.objects.create(name=f'Student {i}', email=f's{i}@example.com')
+            student.courses.set(courses[:i % 4])
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_query_count_does_not_grow_with_students(self):
+        url = reverse('admin_students')
+        self.client.get(url)  # session and role lookups
+        with profile_queries() as profile:
+            response = self.client.get(url)
+        self.assertLess(profile.count, 10)
+        entries = response.context['students_with_gpa']
+        self.assertEqual(len(entries), PAGE_SIZE)
+        for entry in entries:
+            self.assertEqual(entry['student'].enrollment_count, entry['student'].courses.count())
+
+    def test_pages(self):
+        url = reverse('admin_students')
+        first = self.client.get(url).context['page']
+        second = self.client.get(url, {'after': first['next_cursor']}).context['page']
+        self.assertEqual(len(first['items']) + len(second['items']), 60)
+        self.assertIsNone(second['next_cursor'])
+        self.assertEqual(second['prev_cursor'], second['items'][0].pk)
+
+
+class EditCourseTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lecturer = make_user('lecturer', 'lecturer')
+        cls.course = Course.objects.create(
+            name='Algebra', code='MTH101', credit_units=3, lecturer=cls.lecturer.profile,
+        )
+        cls.url = reverse('edit_course', args=[cls.course.pk])
+        cls.data = {'name': 'Linear Algebra', 'code': 'MTH101', 'credit_units': 3, 'capacity': ''}
+
+    def test_students_cannot_edit(self):
+        self.client.force_login(make_user('student', 'student'))
+        response = self.client.post(self.url, {**self.data, 'name': 'HACKED'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.url.startswith(settings.LOGIN_URL))
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.name, 'Algebra')
+
+    def test_admin_edit_returns_to_course_list(self):
+        self.client.force_login(make_user('admin', 'admin'))
+        response = self.client.post(self.url, {**self.data, 'lecturer': self.lecturer.profile.pk})
+        self.assertRedirects(response, reverse('admin_courses'))
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.name, 'Linear Algebra')
+
+    def test_invalid_capacity_is_a_form_error(self):
+        self.client.force_login(self.lecturer)
+        for capacity in ('abc', '-1'):
+            response = self.client.post(self.url, {**self.data, 'capacity': capacity})
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.context['form'].has_error('capacity'))
+            self.assertContains(response, 'Nothing was saved')
+        self.course.refresh_from_db()
+        self.assertEqual((self.course.name, self.course.capacity), ('Algebra', None))
+
+    def test_capacity_can_be_set_and_cleared(self):
+        self.client.force_login(self.lecturer)
+        self.client.post(self.url, {**self.data, 'capacity': '30'})
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.capacity, 30)
+        self.client.post(self.url, self.data)
+        self.course.refresh_from_db()
+        self.assertIsNone(self.course.capacity)
+
+    def test_lecturer_edits_own_course(self):
+        self.client.force_login(self.lecturer)
+        response = self.client.post(self.url, self.data)
+        self.assertRedirects(response, reverse('lecturer_dashboard'))
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.name, 'Linear Algebra')
+
+
+class TermGpaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.spring = Term.objects.create(name='Spring', start_date=datetime.date(2025, 1, 1))
+        cls.autumn = Term.objects.create(name='Autumn', start_date=datetime.date(2025, 8, 1))
+        cls.student = Student.objects.create(name='Ann', email='ann@example.com')
+        cls.maths = Course.objects.create(name='Maths', code='MAT1', credit_units=4, term=cls.spring)
+        cls.art = Course.objects.create(name='Art', code='ART1', credit_units=2, term=cls.autumn)
+        Grade.objects.create(student=cls.student, course=cls.maths, score=75)  # A
+        Grade.objects.create(student=cls.student, course=cls.art, score=45)  # D
+        cls.spring.close()
+
+    def assertSummaryMatchesStored(self):
+        self.student.refresh_from_db()
+        self.assertEqual(gpa_summary(self.student)['cgpa'], round(self.student.gpa, 2))
+
+    def test_gpa_is_latest_term_and_cgpa_is_cumulative(self):
+        summary = gpa_summary(self.student)
+        self.assertEqual((summary['gpa'], summary['cgpa']), (2.0, 4.0))
+        self.assertEqual(top_students(), [{'student': self.student, 'cgpa': 4.0}])
+        self.assertSummaryMatchesStored()
+
+    def test_credit_change_refreezes_closed_terms(self):
+        self.maths.credit_units = 1
+        self.maths.save()
+        self.assertEqual(TermGPA.objects.values_list('points', 'credits').get(term=self.spring), (5, 1))
+        self.assertSummaryMatchesStored()
+
+    def test_term_change_moves_grades(self):
+        self.maths.term = self.autumn
+        self.maths.save()
+        self.assertEqual(set(Grade.objects.values_list('term_id', flat=True)), {self.autumn.pk})
+        self.assertFalse(TermGPA.objects.exists())
+        self.assertEqual(gpa_summary(self.student)['gpa'], 4.0)
+        self.assertSummaryMatchesStored()
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        lecturer = make_user('lee', 'lecturer').profile
+        Profile.objects.filter(pk=lecturer.pk).update(name='Dr Lee')
+        cls.algebra = Course.objects.create(name='Algebra', code='MTH101', credit_units=3, lecturer=lecturer)
+        cls.poetry = Course.objects.create(name='Poetry', code='ENG201', credit_units=2)
+        cls.ann = Student.objects.create(name='Ann', email='ann@example.com')
+        cls.bob = Student.objects.create(name='Bob', email='bob@example.com')
+        cls.algebra.students.add(cls.ann, cls.bob)
+        cls.poetry.students.add(cls.ann)
+        CourseReview.objects.create(course=cls.algebra, student=cls.ann, rating=5, comment='Clear, "well paced"')
+        CourseReview.objects.create(course=cls.poetry, student=cls.ann, rating=3)
+
+    def setUp(self):
+        cache.clear()
+
+    def download(self, url_name):
+        response = self.client.get(reverse(url_name))
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        content = b''.join(response.streaming_content).decode()
+        return response, list(csv.reader(StringIO(content)))
+
+    def test_courses(self):
+        response, rows = self.download('download_courses_csv')
+        self.assertIn('filename="courses.csv"', response['Content-Disposition'])
+        self.assertEqual(rows, [
+            ['Course Name', 'Code', 'Credit Units', 'Lecturer'],
+            ['Algebra', 'MTH101', '3', 'Dr Lee'],
+            ['Poetry', 'ENG201', '2', ''],
+        ])
+
+    def test_students_per_course(self):
+        response, rows = self.download('download_students_per_course_csv')
+        self.assertIn('filename="students_per_course.csv"', response['Content-Disposition'])
+        self.assertEqual(rows, [
+            ['Course', 'Student Name', 'Email'],
+            ['Algebra', 'Ann', 'ann@example.com'],
+            ['Algebra', 'Bob', 'bob@example.com'],
+            ['Poetry', 'Ann', 'ann@example.com'],
+        ])
+
+    def test_reviews(self):
+        response, rows = self.download('download_reviews_csv')
+        self.assertIn('filename="course_reviews.csv"', response['Content-Disposition'])
+        self.assertEqual(rows, [
+            ['Course', 'Student', 'Rating', 'Comment'],
+            ['Algebra', 'Ann', '5', 'Clear, "well paced"'],
+            ['Poetry', 'Ann', '3', ''],
+        ])
+
+    def test_summary(self):
+        response, rows = self.download('download_summary_csv')
+        self.assertIn('filename="system_summary.csv"', response['Content-Disposition'])
+        self.assertEqual(rows, [
+            ['Summary Type', 'Count'],
+            ['Total Courses', '2'],
+            ['Total Students', '3'],
+            ['Total Lecturers', '1'],
+            ['Total Reviews', '2'],
+        ])
+
+    def test_every_export_is_covered(self):
+        self.assertEqual(set(EXPORTS), {'courses', 'students_per_course', 'reviews', 'summary'})
+
+    def test_rows_are_read_lazily(self):
+        response = self.client.get(reverse('download_courses_csv'))
+        with self.assertNumQueries(0):
+            header = next(iter(response.streaming_content))
+        self.assertEqual(header, b'Course Name,Code,Credit Units,Lecturer\r\n')
+
+    def test_summary_counts_are_cached(self):
+        with self.settings(REPORTS_SUMMARY_CACHE_TTL=60):
+            self.assertEqual(summary_counts()['total_courses'], 2)
+            Course.objects.create(name='Logic', code='PHI101', credit_units=3)
+            with self.assertNumQueries(0):
+                self.assertEqual(summary_counts()['total_courses'], 2)
+            cache.delete(SUMMARY_CACHE_KEY)
+            self.assertEqual(summary_counts()['total_courses'], 3)
+
+    def test_summary_counts_uncached_without_ttl(self):
+        with self.settings(REPORTS_SUMMARY_CACHE_TTL=0):
+            summary_counts()
+            Course.objects.create(name='Logic', code='PHI101', credit_units=3)
+            self.assertEqual(summary_counts()['total_courses'], 3)
+        self.assertIsNone(cache.get(SUMMARY_CACHE_KEY))
+
+
+class ExportJobTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+        settings_override = self.settings(
+            MEDIA_ROOT=self.media_root, REPORTS_EXPORT_WORKERS=0, REPORTS_EXPORT_DEDUPE_SECONDS=60,
+            REPORTS_EXPORT_RETENTION_SECONDS=3600,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        Course.objects.create(name='Algebra', code='MTH101', credit_units=3)
+
+    def submit(self, kind):
+        with self.captureOnCommitCallbacks(execute=True):
+            job = submit_export(kind)
+        job.refresh_from_db()
+        return job
+
+    def age(self, job, **delta):
+        ExportJob.objects.filter(pk=job.pk).update(created_at=timezone.now() - datetime.timedelta(**delta))
+
+    def test_job_writes_the_export(self):
+        job = self.submit('courses')
+        self.assertEqual((job.status, job.row_count), (ExportJob.DONE, 1))
+        self.assertTrue(job.file.path.startswith(self.media_root))
+        with job.file.open('rb') as f:
+            self.assertEqual(f.read(), b'Course Name,Code,Credit Units,Lecturer\r\nAlgebra,MTH101,3,\r\n')
+
+    def test_identical_requests_share_a_job(self):
+        job = self.submit('courses')
+        self.assertEqual(self.submit('courses').pk, job.pk)
+        self.assertNotEqual(self.submit('reviews').pk, job.pk)
+        self.assertEqual(ExportJob.objects.count(), 2)
+
+    def test_dedupe_window_and_failures_start_new_jobs(self):
+        job = self.submit('courses')
+        self.age(job, seconds=61)
+        newer = self.submit('courses')
+        self.assertNotEqual(newer.pk, job.pk)
+        ExportJob.objects.filter(pk=newer.pk).update(status=ExportJob.FAILED)
+        self.assertNotIn(self.submit('courses').pk, (job.pk, newer.pk))
+
+    def test_expired_jobs_are_deleted_with_their_files(self):
+        old = self.submit('courses')
+        path = old.file.path
+        self.age(old, hours=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(delete_expired_exports(), 1)
+        self.assertFalse(ExportJob.objects.filter(pk=old.pk).exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_new_jobs_expire_old_ones(self):
+        old = self.submit('courses')
+        self.age(old, hours=2)
+        self.submit('reviews')
+        self.assertEqual(list(ExportJob.objects.values_list('kind', flat=True)), ['reviews'])
+
+    def test_unfinished_jobs_are_kept(self):
+        pending = ExportJob.objects.create(kind='courses')
+        self.age(pending, hours=2)
+        self.assertEqual(delete_expired_exports(), 0)
+        self.assertTrue(ExportJob.objects.filter(pk=pending.pk).exists())
+
+
+class KeysetPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Student.objects.bulk_create([Student(name=f'S{i}', email=f's{i}@example.com') for i in range(7)])
+        cls.ids = list(Student.objects.order_by('pk').values_list('pk', flat=True))
+
+    def page(self, **params):
+        page = keyset_page(Student.objects.all(), RequestFactory().get('/', params), per_page=3)
+        return [s.pk for s in page['items']], page['prev_cursor'], page['next_cursor']
+
+    def test_walks_forward_and_back(self):
+        ids = self.ids
+        self.assertEqual(self.page(), (ids[:3], None, ids[2]))
+        self.assertEqual(self.page(after=ids[2]), (ids[3:6], ids[3], ids[5]))
+        self.assertEqual(self.page(after=ids[5]), (ids[6:], ids[6], None))
+        self.assertEqual(self.page(before=ids[6]), (ids[3:6], ids[3], ids[5]))
+        self.assertEqual(self.page(before=ids[3]), (ids[:3], None, ids[2]))
+
+    def test_bad_or_stale_cursors(self):
+        self.assertEqual(self.page(after='x'), self.page())
+        self.assertEqual(self.page(after=self.ids[-1]), ([], None, None))
+        # A cursor from a row deleted since still lands between its neighbours
+        Student.objects.filter(pk=self.ids[3]).delete()
+        self.assertEqual(self.page(after=self.ids[3])[0], self.ids[4:7])
+
+
+class BulkGradesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lecturer = make_user('lecturer', 'lecturer')
+        cls.course = Course.objects.create(
+            name='Maths', code='MAT1', credit_units=4, lecturer=Profile.objects.get(user=cls.lecturer),
+        )
+        cls.ann = Student.objects.create(name='Ann', email='ann@example.com')
+        cls.bob = Student.objects.create(name='Bob', email='bob@example.com')
+        cls.course.students.add(cls.ann, cls.bob)
+        Grade.objects.create(student=cls.ann, course=cls.course, score=30)
+
+    def setUp(self):
+        self.client.force_login(self.lecturer)
+        self.url = reverse('bulk_grades', args=[self.course.pk])
+
+    def upload(self, content):
+        return self.client.post(self.url, {'csv_file': SimpleUploadedFile('scores.csv', content)})
+
+    def test_upsert_updates_derived_data(self):
+        save_course_grades(self.course, {self.ann.pk: 75, self.bob.pk: 55})
+        self.assertEqual(dict(Grade.objects.values_list('student_id', 'letter')), {self.ann.pk: 'A', self.bob.pk: 'C'})
+        self.ann.refresh_from_db()
+        self.assertEqual((self.ann.gpa, self.ann.total_credits), (5.0, 4))
+        stats = CourseStats.objects.get(pk=self.course.pk)
+        self.assertEqual((stats.grade_count, stats.score_total, stats.pass_count), (2, 130, 2))
+
+    def test_csv_upload(self):
+        response = self.upload(b'email,score\nBOB@example.com,62\n')
+        self.assertRedirects(response, reverse('course_students', args=[self.course.pk]), fetch_redirect_response=False)
+        self.assertEqual(Grade.objects.get(student=self.bob).letter, 'B')
+
+    def test_invalid_csv_saves_nothing(self):
+        response = self.upload(b'email,score\nbob@example.com,62\nnobody@example.com,50\n')
+        self.assertContains(response, 'nobody@example.com is not on this course')
+        self.assertFalse(Grade.objects.filter(student=self.bob).exists())
+
+    def test_headers_ignore_case_and_spaces(self):
+        response = self.upload(b'Email , SCORE\r\nbob@example.com,62\r\n')
+        self.assertRedirects(response, reverse('course_students', args=[self.course.pk]), fetch_redirect_response=False)
+        self.assertEqual(Grade.objects.get(student=self.bob).score, 62)
+
+    def test_missing_columns_are_reported(self):
+        response = self.upload(b'mail,points\nbob@example.com,62\n')
+        self.assertContains(response, 'must name the columns: email, score')
+
+    def test_errors_give_file_line_numbers(self):
+        # The blank line is skipped but still counted
+        response = self.upload(b'email,score\n\nnobody@example.com,50\n')
+        self.assertContains(response, 'Line 3: nobody@example.com is not on this course')
+
+    def test_non_utf8_csv_is_a_form_error(self):
+        response = self.upload('email,score\nbob@example.com,62 caf\xe9\n'.encode('latin-1'))
+        self.assertContains(response, 'must be saved as UTF-8')
+
+    def test_other_lecturers_course_is_not_found(self):
+        self.client.force_login(make_user('other', 'lecturer'))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.assertEqual(self.client.post(self.url, {f'score_{self.bob.pk}': 90}).status_code, 404)
+
+
+class CourseRosterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = Course.objects.create(name='Maths', code='MAT1', credit_units=4)
+        other = Course.objects.create(name='Art', code='ART1', credit_units=2)
+        cls.enrolled = Student.objects.create(name='Enrolled', email='enrolled@example.com')
+        cls.graded = Student.objects.create(name='Graded', email='graded@example.com')
+        cls.both = Student.objects.create(name='Both', email='both@example.com')
+        cls.outsider = Student.objects.create(name='Outsider', email='outsider@example.com')
+        cls.course.students.add(cls.enrolled, cls.both)
+        other.students.add(cls.outsider)
+        Grade.objects.create(student=cls.graded, course=cls.course, score=65)
+        Grade.objects.create(student=cls.both, course=cls.course, score=35)
+        Grade.objects.create(student=cls.outsider, course=other, score=90)
+
+    def test_enrolled_or_graded_with_their_grade(self):
+        with self.assertNumQueries(1):
+            entries = roster_entries(course_roster(self.course).order_by('name'), self.course)
+        self.assertEqual(
+            [(e['student'], e['grade'] and (e['grade'].score, e['grade'].letter)) for e in entries],
+            [(self.both, (35, 'F')), (self.enrolled, None), (self.graded, (65, 'B'))],
+        )
+        self.assertEqual(entries[0]['grade'].pk, Grade.objects.get(student=self.both, course=self.course).pk)
+
+
+class RoleCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('staff', 'admin')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        self.url = reverse('admin_dashboard')
+
+    def test_role_is_kept_in_the_session(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertFalse([q['sql'] for q in queries if 'COALESCE' in q['sql'] and 'FROM "reports_profile"' in q['sql']])
+
+    def test_demotion_applies_on_next_request(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        profile = Profile.objects.get(user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.role = 'student'
+            profile.save()
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+
+class CourseSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        lecturer = Profile.objects.get(user=make_user('lecturer', 'lecturer'))
+        lecturer.name = 'Grace Physics'
+        lecturer.save()
+        cls.physics = Course.objects.create(name='Physics', code='PHY101', credit_units=3)
+        cls.quantum = Course.objects.create(name='Quantum Physics', code='PHY201', credit_units=3)
+        cls.optics = Course.objects.create(name='Optics', code='OPT101', credit_units=3, lecturer=lecturer)
+        cls.history = Course.objects.create(name='History', code='HIS101', credit_units=3)
+
+    def search(self, query, **params):
+        page = search_courses(query, RequestFactory().get('/', params), per_page=2)
+        return [course.pk for course in page['items']], page['has_next']
+
+    def test_fts_ranks_name_over_lecturer(self):
+        if not fts_available():
+            self.skipTest("SQLite without FTS5")
+        ids, has_next = self.search('phys')
+        self.assertEqual(ids, [self.physics.pk, self.quantum.pk])
+        self.assertTrue(has_next)
+        self.assertEqual(self.search('phys', page=2), ([self.optics.pk], False))
+        self.assertEqual(self.search('quant phy'), ([self.quantum.pk], False))
+        self.assertEqual(self.search('"phy OR his'), ([], False))  # operators are matched literally
+
+    def test_index_follows_course_and_lecturer_edits(self):
+        if not fts_available():
+            self.skipTest("SQLite without FTS5")
+        self.history.name = 'Ancient Greece'
+        self.history.save()
+        self.assertEqual(self.search('ancient'), ([self.history.pk], False))
+        self.optics.lecturer.name = 'Ada Lovelace'
+        self.optics.lecturer.save()
+        self.assertEqual(self.search('lovelace'), ([self.optics.pk], False))
+        self.optics.delete()
+        self.assertEqual(self.search('lovelace'), ([], False))
+
+    def test_prefix_fallback(self):
+        with mock.patch('reports.search.fts_available', return_value=False):
+            # Fields must start with the word: name beats code beats lecturer
+            self.assertEqual(self.search('phy'), ([self.physics.pk, self.quantum.pk], False))
+            self.assertEqual(self.search('grace'), ([self.optics.pk], False))
+            self.assertEqual(self.search('his1'), ([self.history.pk], False))
+
+    def test_short_words_still_filter(self):
+        # Too short to rank, but only courses with a field starting with them match
+        for fts in (True, False):
+            with mock.patch('reports.search.fts_available', return_value=fts):
+                self.assertEqual(self.search('o'), ([self.optics.pk], False))
+                self.assertEqual(self.search('q p'), ([self.quantum.pk], False))
+                self.assertEqual(self.search('x'), ([], False))
+
+    def test_candidates_are_limited_by_queryset(self):
+        page = search_courses('phys', RequestFactory().get('/'), queryset=Course.objects.exclude(pk=self.physics.pk))
+        self.assertEqual([course.pk for course in page['items']], [self.quantum.pk, self.optics.pk])
+
+
+class ToggleCourseTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = Student.objects.create(name='Ann', email='ann@example.com')
+        cls.course = Course.objects.create(name='Maths', code='MAT1', credit_units=4)
+
+    def toggle(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return enrollment.toggle_course(self.student.pk, self.course.pk)
+
+    def test_toggles_one_through_row(self):
+        versions = fragment_versions({'own': [student_version(self.student.pk)]})
+        self.assertEqual(self.toggle(), enrollment.ENROLLED)
+        self.assertEqual(list(self.student.courses.all()), [self.course])
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.seats_taken, 1)  # m2m_changed still fires
+        self.assertNotEqual(fragment_versions({'own': [student_version(self.student.pk)]}), versions)
+
+        self.assertEqual(self.toggle(), enrollment.DROPPED)
+        self.assertFalse(self.student.courses.exists())
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.seats_taken, 0)
+
+    def test_repeated_enroll_is_a_no_op(self):
+        for _ in range(2):
+            self.assertEqual(enrollment.enroll(self.student.pk, self.course.pk), enrollment.ENROLLED)
+        self.assertEqual(Course.students.through.objects.count(), 1)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.seats_taken, 1)
+
+
+class SeatsAndWaitlistTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = Course.objects.create(name='Maths', code='MAT1', credit_units=4, capacity=2)
+        cls.students = [Student.objects.create(name=f'S{i}', email=f's{i}@example.com') for i in range(5)]
+
+    def ids(self):
+        return set(self.course.students.values_list('pk', flat=True))
+
+    def queue(self):
+        return list(self.course.waitlist.order_by('pk').values_list('student_id', flat=True))
+
+    def test_full_course_queues_and_drops_promote_in_order(self):
+        a, b, c, d, e = [s.pk for s in self.students]
+        outcomes = [enrollment.enroll(pk, self.course.pk) for pk in (a, b, c, d)]
+        self.assertEqual(outcomes, [enrollment.ENROLLED] * 2 + [enrollment.WAITLISTED] * 2)
+        self.assertEqual((self.ids(), self.queue()), ({a, b}, [c, d]))
+        self.assertEqual(enrollment.waitlist_position(d, self.course.pk), 2)
+
+        self.assertEqual(enrollment.drop(a, self.course.pk), enrollment.DROPPED)
+        self.assertEqual((self.ids(), self.queue()), ({b, c}, [d]))
+        self.assertEqual(enrollment.toggle_course(d, self.course.pk), enrollment.LEFT_WAITLIST)
+        self.assertEqual(self.queue(), [])
+
+        enrollment.enroll(e, self.course.pk)
+        self.course.capacity = 3
+        self.course.save()
+        self.assertEqual((self.ids(), self.queue()), ({b, c, e}, []))
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.seats_taken, 3)
+
+    def test_seat_is_only_taken_below_capacity(self):
+        self.assertTrue(enrollment._take_seat(self.course.pk))
+        self.assertTrue(enrollment._take_seat(self.course.pk))
+        self.assertFalse(enrollment._take_seat(self.course.pk))
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.seats_taken, 2)
+
+    def test_deleting_a_student_frees_their_seat(self):
+        a, b, c = [s.pk for s in self.students[:3]]
+        for pk in (a, b, c):
+            enrollment.enroll(pk, self.course.pk)
+        self.students[0].delete()
+        self.assertEqual((self.ids(), self.queue()), ({b, c}, []))
+
+
+class StudentEnrollmentViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = Student.objects.create(name='Ann', email='ann@example.com')
+        cls.user = make_user('ann', 'student', student=cls.student)
+        cls.course = Course.objects.create(name='Maths', code='MAT1', credit_units=4, capacity=1)
+        taken = Student.objects.create(name='Bob', email='bob@example.com')
+        enrollment.enroll(taken.pk, cls.course.pk)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        self.url = reverse('student_detail', args=[self.student.pk])
+
+    def post(self):
+        # Fragment versions are bumped on commit, before the redirect is followed
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {'course_id': self.course.pk})
+        self.assertRedirects(response, self.url, fetch_redirect_response=False)
+        return self.client.get(self.url)
+
+    def test_full_course_offers_and_reports_the_waitlist(self):
+        self.assertContains(self.client.get(self.url), 'Join waitlist')
+        response = self.post()
+        self.assertContains(response, 'Maths is full. You are number 1 on its waitlist.')
+        self.assertContains(response, 'Leave waitlist')
+
+        response = self.post()
+        self.assertContains(response, 'You left the waitlist for Maths.')
+        self.assertContains(response, 'Join waitlist')
+        self.assertFalse(self.course.waitlist.exists())
+
+    def test_enroll_is_reported(self):
+        self.course.capacity = None
+        self.course.save()
+        response = self.post()
+        self.assertContains(response, 'You are enrolled in Maths.')
+        self.assertTrue(self.student.courses.filter(pk=self.course.pk).exists())
+
+
+class BulkEnrollmentImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = make_user('admin', 'admin')
+        cls.ann = Student.objects.create(name='Ann', email='Ann@Example.com')
+        cls.bob = Student.objects.create(name='Bob', email='bob@example.com')
+        cls.cat = Student.objects.create(name='Cat', email='cat@example.com')
+        cls.maths = Course.objects.create(name='Maths', code='MAT1', credit_units=4, capacity=1)
+        cls.art = Course.objects.create(name='Art', code='ART1', credit_units=2)
+        Course.objects.create(name='Art again', code='art1', credit_units=2)
+        cls.history = Course.objects.create(name='History', code='HIS1', credit_units=2)
+        cls.history.students.add(cls.cat)
+        enrollment.enroll(cls.bob.pk, cls.maths.pk)
+        enrollment.enroll(cls.cat.pk, cls.maths.pk)  # waitlisted
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def upload(self, content):
+        return self.client.post(reverse('admin_bulk_enroll'), {'csv_file': SimpleUploadedFile('rows.csv', content)})
+
+    def test_import_reports_each_row(self):
+        rows = [
+            (2, 'ann@example.com', 'his1'),  # matched case-insensitively
+            (3, 'nobody@example.com', 'HIS1'),
+            (4, 'ann@example.com', 'ART1'),  # ambiguous code
+            (5, 'CAT@example.com', 'HIS1'),  # already enrolled
+            (6, 'ann@example.com', 'MAT1'),  # full
+            (7, 'ann@example.com', 'NOPE'),
+            (8, 'ann@example.com', 'HIS1'),  # repeated
+        ]
+        result = enrollment.import_enrollments(rows, chunk_size=3)
+        self.assertEqual((result.rows, result.created, result.existing, result.error_count), (7, 1, 2, 4))
+        self.assertEqual(sorted(line for line, _ in result.errors), [3, 4, 6, 7])
+        self.assertEqual(set(self.history.students.all()), {self.ann, self.cat})
+        self.history.refresh_from_db()
+        self.assertEqual(self.history.seats_taken, 2)
+
+    def test_import_removes_the_students_waitlist_place(self):
+        # A free seat that save() hasn't handed to the waitlist yet
+        Course.objects.filter(pk=self.maths.pk).update(capacity=2)
+        self.assertTrue(self.maths.waitlist.filter(student=self.cat).exists())
+        result = enrollment.import_enrollments([(2, 'cat@example.com', 'MAT1')])
+        self.assertEqual((result.created, result.error_count), (1, 0))
+        self.assertFalse(WaitlistEntry.objects.filter(course=self.maths, student=self.cat).exists())
+        self.maths.refresh_from_db()
+        self.assertEqual(self.maths.seats_taken, 2)
+        self.assertEqual(set(self.maths.students.all()), {self.bob, self.cat})
+
+    def test_lookups_use_the_lower_indexes(self):
+        for queryset in (
+            Student.objects.annotate(key=Lower('email')).filter(key__in=['ann@example.com']),
+            Course.objects.annotate(key=Lower('code')).filter(key__in=['his1']),
+        ):
+            self.assertNotIn('SCAN', queryset.explain())
+
+    def test_upload(self):
+        response = self.upload(b'Email,Course_Code\nann@example.com,HIS1\n')
+        self.assertEqual(response.context['result'].created, 1)
+
+    def test_bad_bytes_late_in_the_file_import_nothing(self):
+        content = b'email,course_code\n' + b'ann@example.com,HIS1\n' * 5000 + b'caf\xe9@example.com,HIS1\n'
+        response = self.upload(content)
+        self.assertContains(response, 'must be saved as UTF-8')
+        self.assertIsNone(response.context['result'])
+        self.assertFalse(self.history.students.filter(pk=self.ann.pk).exists())
+
+    def test_errors_give_file_line_numbers(self):
+        # Blank lines and a quoted field spanning two lines still count
+        content = b'email,course_code\n\nann@example.com,HIS1\n"no\nbody@example.com",HIS1\nann@example.com,NOPE\n'
+        response = self.upload(content)
+        self.assertEqual([line for line, _ in response.context['result'].errors], [5, 6])
+
+    def test_missing_columns(self):
+        self.assertContains(self.upload(b'name,code\nAnn,HIS1\n'), 'must name the columns')
@@ -25,6 +25,7 @@ urlpatterns = [
     path('dashboard/lecturer/course/<int:course_id>/reviews/', views.course_reviews, name='course_reviews'),
     path('dashboard/lecturer/course/<int:course_id>/students/', views.course_students, name='course_students'),
     path('dashboard/lecturer/course/<int:course_id>/grade/<int:student_id>/', views.update_grade, name='update_grade'),
+    path('dashboard/lecturer/course/<int:course_id>/grades/bulk/', views.bulk_grades, name='bulk_grades'),
     path('dashboard/lecturer/course/create/', views.create_course, name='create_course'),
     path('dashboard/lecturer/course/<int:course_id>/edit/', views.edit_course, name='edit_course'),
     path('reports/courses/<int:course_id>/review/', views.submit_review, name='submit_review'),
@@ -43,6 +44,8 @@ urlpatterns = [
     path('dashboard/admin/lecturers/<int:lecturer_id>/edit/', views.edit_lecturer, name='edit_lecturer'),
     path('dashboard/admin/course/<int:course_id>/delete/', views.delete_course, name='delete_course'),
     path('dashboard/admin/create_course/', views.admin_create_course, name='admin_create_course'),
+    path('dashboard/admin/enrollments/import/', views.admin_bulk_enroll, name='admin_bulk_enroll'),
+    path('dashboard/admin/queries/', views.admin_query_profile, name='admin_query_profile'),
     path('admin/student/<int:student_id>/', views.student_report, name='student_report'),
     path('dashboard/admin/course/<int:course_id>/students/', views.admin_course_students, name='admin_course_students'),
     
@@ -52,6 +55,12 @@ urlpatterns = [
     path('download/reviews/', views.download_reviews_csv, name='download_reviews_csv'),
     path('download/summary/', views.download_summary_csv, name='download_summary_csv'),
 
+    # Background export jobs
+    path('dashboard/admin/exports/<str:kind>/', views.admin_export_submit, name='admin_export_submit'),
+    path('dashboard/admin/exports/job/<int:job_id>/', views.admin_export_job, name='admin_export_job'),
+    path('dashboard/admin/exports/job/<int:job_id>/status/', views.admin_export_status, name='admin_export_status'),
+    path('dashboard/admin/exports/job/<int:job_id>/download/', views.admin_export_download, name='admin_export_download'),
+
 
     path('logout/', views.logout_view, name='logout'),
 
@@ -1,39 +1,316 @@
-from .models import Grade
-
-LETTER_POINTS = {
-    'A': 5,
-    'B': 4,
-    'C': 3,
-    'D': 2,
-    'F': 0,
-}
-
-def calculate_gpa(student):
-    grades = Grade.objects.filter(student=student)
-    if not grades.exists():
-        return 0  # GPA
-
-    total_points = 0
-    total_credits = 0
-
-    for grade in grades:
-        points = LETTER_POINTS.get(grade.letter, 0)
-        total_points += points * grade.course.credit_units
-        total_credits += grade.course.credit_units
-
-    gpa = total_points / total_credits if total_credits else 0
-    return round(gpa, 2)
-
-def calculate_cgpa(student):
-    grades = student.grade_set.all()  # all grades for the student
-    total_points = 0
-    total_credits = 0
-
-    for grade in grades:
-        points = LETTER_POINTS.get(grade.letter, 0)
-        total_points += points * grade.course.credit_units
-        total_credits += grade.course.credit_units
-
-    if total_credits == 0:
-        return 0
-    return round(total_points / total_credits, 2)
+import datetime
+
+from django.db import transaction
+from django.db.models import Case, Exists, F, FilteredRelation, FloatField, OuterRef, Prefetch, Q, Sum, Value, When, prefetch_related_objects
+from django.db.models.functions import Cast
+
+from .fragments import bump, student as student_version
+from .grading import letters_for_scores
+from .models import (
+    LETTER_POINTS, Course, CourseReview, Grade, Student, Term, TermGPA, grade_point_expression,
+    rebuild_course_stats,
+)
+
+
+# Terms sort by start date; grades recorded before terms existed come first
+NO_TERM = (datetime.date.min, 0)
+
+
+def _term_key(start_date, term_id):
+    return NO_TERM if term_id is None else (start_date, term_id)
+
+
+def _summarise(terms):
+    # terms: {term key: [points, credits]}. GPA is the latest term's,
+    # CGPA folds every term.
+    total_points = sum(points for points, _ in terms.values())
+    total_credits = sum(credits for _, credits in terms.values())
+    latest_points, latest_credits = terms[max(terms)] if terms else (0, 0)
+
+    return {
+        'gpa': round(latest_points / latest_credits, 2) if latest_credits else 0,
+        'cgpa': round(total_points / total_credits, 2) if total_credits else 0,
+        'total_credits': total_credits,
+    }
+
+
+def _add(terms, key, points, credits):
+    totals = terms.setdefault(key, [0, 0])
+    totals[0] += points
+    totals[1] += credits
+
+
+def _prefetched_terms(student):
+    # Per-term totals from grades already loaded with their course and term
+    # (see with_grades), or None if using them would trigger more queries.
+    grades = getattr(student, '_prefetched_objects_cache', {}).get('grade_set')
+    if grades is None:
+        return None
+    terms = {}
+    for grade in grades:
+        if not Grade.course.is_cached(grade):
+            return None
+        if grade.term_id is not None and not Grade.term.is_cached(grade):
+            return None
+        key = _term_key(grade.term.start_date if grade.term_id else None, grade.term_id)
+        units = grade.course.credit_units
+        _add(terms, key, grade.grade_point * units, units)
+    return terms
+
+
+def gpa_summary(students):
+    """GPA and CGPA for one student or an iterable of students.
+
+    For a single student returns {'gpa', 'cgpa', 'total_credits'}; for an
+    iterable returns a dict of those keyed by student id. GPA is for the
+    student's latest term and CGPA covers all terms. Prefetched grades are
+    used as-is; otherwise closed terms come from their TermGPA snapshots
+    and only grades in open terms are read, in two queries overall.
+    """
+    if isinstance(students, Student):
+        return gpa_summary([students])[students.pk]
+
+    terms_by_student = {}
+    missing = []
+    for student in students:
+        terms = _prefetched_terms(student)
+        if terms is None:
+            missing.append(student.pk)
+            terms = {}
+        terms_by_student[student.pk] = terms
+
+    if missing:
+        snapshots = TermGPA.objects.filter(student_id__in=missing).values_list(
+            'student_id', 'term__start_date', 'term_id', 'points', 'credits'
+        )
+        for student_id, start_date, term_id, points, credits in snapshots:
+            _add(terms_by_student[student_id], _term_key(start_date, term_id), points, credits)
+
+        live_grades = (
+            Grade.objects.filter(student_id__in=missing)
+            .exclude(term__is_closed=True)
+            .values_list('student_id', 'term__start_date', 'term_id', 'letter', 'course__credit_units')
+        )
+        for student_id, start_date, term_id, letter, units in live_grades:
+            _add(terms_by_student[student_id], _term_key(start_date, term_id), LETTER_POINTS.get(letter, 0) * units, units)
+
+    return {student_id: _summarise(terms) for student_id, terms in terms_by_student.items()}
+
+
+def with_grades(queryset):
+    # Prefetch each student's grades, courses and terms so gpa_summary and
+    # the templates can use them without further queries
+    return queryset.prefetch_related(
+        Prefetch('grade_set', queryset=Grade.objects.select_related('course', 'term'))
+    )
+
+
+
+def student_detail_data(student):
+    """Everything student_detail renders, in three queries.
+
+    Grades (with course and term), enrolled courses and the student's
+    reviews are each fetched once and indexed by course id. Each course in
+    enrolled_courses also gets student_grade and student_review attributes
+    so the template can use them without further queries.
+    """
+    prefetch_related_objects([student], Prefetch('grade_set', queryset=Grade.objects.select_related('course__lecturer', 'term')))
+    grades = student.grade_set.all()
+    grades_by_course = {grade.course_id: grade for grade in grades}
+    reviews_by_course = {review.course_id: review for review in CourseReview.objects.filter(student=student)}
+
+    # Enrolled via the M2M, plus any course the student has a grade for
+    enrolled = {course.id: course for course in student.courses.select_related('lecturer')}
+    for grade in grades:
+        enrolled.setdefault(grade.course_id, grade.course)
+    for course in enrolled.values():
+        course.student_grade = grades_by_course.get(course.id)
+        course.student_review = reviews_by_course.get(course.id)
+
+    return {
+        'grades': grades,
+        'enrolled_courses': list(enrolled.values()),
+        'grades_by_course': grades_by_course,
+        'reviews_by_course': reviews_by_course,
+    }
+
+# GPA aggregation done by the database: one grouped query over
+# Student -> Grade -> Course instead of a query per student. Used to
+# (re)build the stored Student.gpa, which the read paths use directly.
+
+def annotate_gpa(queryset=None):
+    """Annotate students with gpa_points, gpa_units and gpa_value.
+
+    Students without grades get gpa_value 0.0, matching calculate_gpa.
+    """
+    if queryset is None:
+        queryset = Student.objects.all()
+
+    credit_units = F('grade__course__credit_units')
+    queryset = queryset.annotate(
+        gpa_points=Sum(grade_point_expression('grade__letter') * credit_units),
+        gpa_units=Sum(credit_units),
+    )
+    return queryset.annotate(
+        gpa_value=Case(
+            When(gpa_units__gt=0, then=Cast('gpa_points', FloatField()) / Cast('gpa_units', FloatField())),
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+    )
+
+
+def recalculate_gpa(queryset=None, batch_size=1000):
+    """Rebuild the stored Student.gpa / total_credits from grades.
+
+    Returns the number of students written.
+    """
+    students = annotate_gpa(queryset).order_by('id').iterator(chunk_size=batch_size)
+    batch = []
+    count = 0
+    for student in students:
+        student.gpa = student.gpa_value
+        student.total_credits = student.gpa_units or 0
+        batch.append(student)
+        if len(batch) >= batch_size:
+            Student.objects.bulk_update(batch, ['gpa', 'total_credits'])
+            count += len(batch)
+            batch = []
+    if batch:
+        Student.objects.bulk_update(batch, ['gpa', 'total_credits'])
+        count += len(batch)
+    # bulk_update sends no signals
+    bump('students')
+    return count
+
+
+def _cgpa_rows(students):
+    # [{'student': ..., 'cgpa': ...}] from the stored Student.gpa column,
+    # which covers every term: the CGPA, not the latest-term GPA
+    return [{'student': student, 'cgpa': round(student.gpa, 2)} for student in students]
+
+
+def students_with_gpa(queryset=None):
+    # Latest-term GPA and CGPA per student, via gpa_summary
+    if queryset is None:
+        queryset = Student.objects.all()
+    students = list(queryset)
+    summaries = gpa_summary(students)
+    return [
+        {'student': student, 'gpa': summaries[student.pk]['gpa'], 'cgpa': summaries[student.pk]['cgpa']}
+        for student in students
+    ]
+
+
+def top_students(limit=5, queryset=None):
+    # Highest CGPA first; equal CGPAs keep registration (id) order so the
+    # ranking is stable between requests. LIMIT is applied in SQL.
+    if queryset is None:
+        queryset = Student.objects.all()
+    return _cgpa_rows(queryset.order_by('-gpa', 'id')[:limit])
+
+
+
+def save_course_grades(course, scores):
+    """Write already-validated {student_id: score} for one course at once.
+
+    Letters are worked out for the whole batch first, then every row is
+    inserted or updated by a single bulk_create upsert on (student, course)
+    inside one transaction. Stored GPAs and closed-term snapshots of the
+    affected students are rebuilt afterwards, since bulk_create skips
+    Grade.save(). Returns the number of grades written.
+    """
+    student_ids = list(scores)
+    letters = letters_for_scores([scores[student_id] for student_id in student_ids])
+    grades = [
+        Grade(student_id=student_id, course=course, score=int(scores[student_id]), letter=letter, term_id=course.term_id)
+        for student_id, letter in zip(student_ids, letters)
+    ]
+
+    with transaction.atomic():
+        Grade.objects.bulk_create(
+            grades,
+            update_conflicts=True,
+            unique_fields=['student', 'course'],
+            update_fields=['score', 'letter'],
+            batch_size=500,
+        )
+        recalculate_gpa(Student.objects.filter(pk__in=student_ids))
+        term_ids = Grade.objects.filter(course=course, student_id__in=student_ids).values('term_id')
+        for term in Term.objects.filter(pk__in=term_ids, is_closed=True):
+            term.freeze(student_ids)
+        rebuild_course_stats([course.pk])
+    bump('grades', *[student_version(student_id) for student_id in student_ids])
+    return len(grades)
+
+
+# Course roster: students enrolled in a course or holding a grade for it,
+# each with that grade (or None), from one LEFT JOIN query.
+
+def course_roster(course):
+    enrolled = Course.students.through.objects.filter(course_id=course.pk, student_id=OuterRef('pk'))
+    return (
+        Student.objects.annotate(course_grade=FilteredRelation('grade', condition=Q(grade__course_id=course.pk)))
+        .filter(Q(Exists(enrolled)) | Q(course_grade__isnull=False))
+        .annotate(
+            roster_grade_id=F('course_grade__id'),
+            roster_score=F('course_grade__score'),
+            roster_letter=F('course_grade__letter'),
+        )
+    )
+
+
+def roster_entries(students, course):
+    # [{'student': ..., 'grade': Grade or None}] for students from course_roster
+    entries = []
+    for student in students:
+        grade = None
+        if student.roster_grade_id is not None:
+            grade = Grade(
+                id=student.roster_grade_id, student=student, course=course,
+                score=student.roster_score, letter=student.roster_letter,
+            )
+        entries.append({'student': student, 'grade': grade})
+    return entries
+
+# Keyset (seek) pagination: pages are addressed by the last/first primary
+# key seen rather than an OFFSET, so every page costs the same to fetch.
+
+PAGE_SIZE = 50
+
+
+def _cursor(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def keyset_page(queryset, request, per_page=PAGE_SIZE):
+    """One page of `queryset` in primary-key order.
+
+    Reads ?after=<pk> / ?before=<pk> from the request and returns
+    {'items', 'next_cursor', 'prev_cursor'}; a cursor is None when there
+    is no page in that direction.
+    """
+    after = _cursor(request.GET.get('after'))
+    before = _cursor(request.GET.get('before'))
+
+    if before is not None:
+        items = list(queryset.filter(pk__lt=before).order_by('-pk')[:per_page + 1])
+        has_prev = len(items) > per_page
+        items = items[:per_page][::-1]
+        has_next = True
+    else:
+        if after is not None:
+            queryset = queryset.filter(pk__gt=after)
+        items = list(queryset.order_by('pk')[:per_page + 1])
+        has_next = len(items) > per_page
+        items = items[:per_page]
+        has_prev = after is not None
+
+    return {
+        'items': items,
+        'next_cursor': items[-1].pk if items and has_next else None,
+        'prev_cursor': items[0].pk if items and has_prev else None,
+    }
@@ -1,19 +1,49 @@
 
 from django.shortcuts import render,  get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
-from .decorators import student_required, lecturer_required, admin_required
-from .models import Student, Grade, Course, CourseReview, Profile
+from .decorators import student_required, lecturer_required, admin_required, course_staff_required
+from .middleware import get_role
+from .models import Student, Grade, Course, CourseReview, ExportJob, Profile
 from django.contrib.auth import authenticate, login, logout
-from .forms import CourseForm
-from .utils import calculate_gpa, calculate_cgpa
+from .forms import BulkEnrollmentForm, BulkGradeForm, CourseEditForm, CourseForm
+from .utils import (
+    course_roster, gpa_summary, keyset_page, roster_entries, save_course_grades, student_detail_data,
+    students_with_gpa, top_students, with_grades,
+)
+from django.conf import settings
+from django.db.models import Count
 from django.contrib import messages
-import csv
-from django.http import HttpResponse
+from django.http import FileResponse, Http404, JsonResponse
+from django.urls import reverse
+from .enrollment import (
+    DROPPED, ENROLLED, LEFT_WAITLIST, WAITLISTED, import_enrollments, toggle_course, waitlist_position,
+)
+from .search import search_courses
+from .exports import EXPORTS, stream_export
+from .export_jobs import submit_export
+from .fragments import bump, fragment_versions, lazy, student as student_version
+from .profiling import budget_for, repeat_threshold, reset_stats, view_stats
 
 
 
 # Create your views here.
 
+def _toggle_and_report(request, student_id, course):
+    # Enroll/drop through the enrollment engine and tell the student what
+    # actually happened (a full course puts them on the waitlist instead)
+    outcome = toggle_course(student_id, course.id)
+    if outcome == ENROLLED:
+        messages.success(request, f"You are enrolled in {course.name}.")
+    elif outcome == WAITLISTED:
+        position = waitlist_position(student_id, course.id)
+        messages.info(request, f"{course.name} is full. You are number {position} on its waitlist.")
+    elif outcome == LEFT_WAITLIST:
+        messages.info(request, f"You left the waitlist for {course.name}.")
+    elif outcome == DROPPED:
+        messages.success(request, f"You are no longer enrolled in {course.name}.")
+    return outcome
+
+
 def student_list(request):
     students = Student.objects.all()
     return render(request, "reports/student_list.html", {"students": students})
@@ -25,61 +55,53 @@ def student_list(request):
 def student_detail(request, student_id):
     student = get_object_or_404(Student, id=student_id)
 
-    # Courses enrolled via ManyToManyField
-    enrolled_courses_m2m = list(student.courses.all())
-
-    # Courses that the student has grades for
-    courses_with_grades = list(Course.objects.filter(grade__student=student).distinct())
-
-    # Merge the two lists, remove duplicates
-    enrolled_courses = list({c.id: c for c in enrolled_courses_m2m + courses_with_grades}.values())
-    
-
-
-    # Available courses for enrollment (exclude already enrolled)
-    available_courses = Course.objects.exclude(id__in=[c.id for c in enrolled_courses])
-
     # Handle enroll/unenroll
     if request.method == 'POST':
         course_id = request.POST.get('course_id')
         course = get_object_or_404(Course, id=course_id)
-        if student in course.students.all():
-            course.students.remove(student)
-        else:
-            course.students.add(student)
+        _toggle_and_report(request, student.id, course)
         return redirect('student_detail', student_id=student.id)
 
-    # Grades and reviews
-    grades = Grade.objects.filter(student=student)
-
-    # Semester remark
-    if all(grade.np_status == "NP" for grade in grades):
-        semester_remark = "Normal Progress"
-    else:
-        semester_remark = "Attention Needed"
-    
-    # Calculate GPA dynamically (or use stored value)
-    gpa = calculate_gpa(student)
-    cgpa = calculate_cgpa(student)  # cumulative
-    
-    # Prepare a list for template
-    courses_with_reviews = []
-    for course in enrolled_courses:
-        review = course.reviews.filter(student=student).first()
-        courses_with_reviews.append({
-            'course': course,
-            'review': review
-        })
-
+    # Grades, enrolled courses and reviews, one query each, but only when a
+    # block that shows them isn't cached (see fragments.py)
+    data = lazy(lambda: student_detail_data(student))
+
+    def available_courses():
+        # Courses open for enrollment (exclude already enrolled), marked
+        # with whether the student is already waiting for a seat
+        enrolled_ids = [c.id for c in data()['enrolled_courses']]
+        courses = list(Course.objects.select_related('lecturer').exclude(id__in=enrolled_ids))
+        waitlisted_ids = set(student.waitlist_entries.values_list('course_id', flat=True))
+        for course in courses:
+            course.is_waitlisted = course.id in waitlisted_ids
+        return courses
+
+    def semester_remark():
+        if all(grade.np_status == "NP" for grade in data()['grades']):
+            return "Normal Progress"
+        return "Attention Needed"
+
+    def summary():
+        # GPA and CGPA from the prefetched grades, no extra queries
+        data()
+        return gpa_summary(student)
+
+    summary = lazy(summary)
+    own = student_version(student.id)
     context = {
         'student': student,
-        'enrolled_courses': enrolled_courses,
-        'available_courses': available_courses,
-        'grades': grades,
-        'gpa' : gpa,
-        'cgpa' : cgpa,
-        'semester_remark': semester_remark,
-        'enrolled_courses': enrolled_courses,
+        'enrolled_courses': lazy(lambda: data()['enrolled_courses']),
+        'available_courses': lazy(available_courses),
+        'grades': lazy(lambda: data()['grades']),
+        'gpa': lazy(lambda: summary()['gpa']),
+        'cgpa': lazy(lambda: summary()['cgpa']),
+        'semester_remark': lazy(semester_remark),
+        'versions': fragment_versions({
+            'enrolled': [own, 'courses', 'profiles'],
+            'grades': [own, 'courses'],
+            'available': [own, 'courses', 'profiles', 'enrollments'],  # enrollments: seats left
+        }),
+        'fragment_ttl': settings.REPORTS_FRAGMENT_CACHE_TTL,
     }
     return render(request, 'reports/student_detail.html', context)
 
@@ -94,36 +116,35 @@ def course_list(request, student_id):
     # Courses available to enroll (not graded yet)
     available_courses = Course.objects.exclude(id__in=graded_course_ids)
 
-    # Optional search/filter
-    query = request.GET.get('q')
-    if query:
-        available_courses = available_courses.filter(name__icontains=query)
-
     # Handle enroll/unenroll
     if request.method == 'POST':
         course_id = request.POST.get('course_id')
         course = get_object_or_404(Course, id=course_id)
-        if student in course.students.all():
-            course.students.remove(student)
-        else:
-            course.students.add(student)
+        _toggle_and_report(request, student.id, course)
         return redirect('course_list', student_id=student.id)  # back to the same page
 
+    # Optional search over name, code and lecturer, one ranked page at a time
+    query = request.GET.get('q', '')
+    page = search_courses(query, request, queryset=available_courses)
+    page_ids = [c.id for c in page['items']]
+    enrolled_ids = set(student.courses.filter(id__in=page_ids).values_list('id', flat=True))
+    waitlisted_ids = set(student.waitlist_entries.filter(course_id__in=page_ids).values_list('course_id', flat=True))
+    for course in page['items']:
+        course.is_enrolled = course.id in enrolled_ids
+        course.is_waitlisted = course.id in waitlisted_ids
+
     context = {
         'student': student,
-        'available_courses': available_courses,
-        'query': query or "",
+        'available_courses': page['items'],
+        'page': page,
+        'query': query,
     }
     return render(request, 'reports/course_list.html', context)
 
 
 def toggle_enrollment(request, course_id):
     course = get_object_or_404(Course, id=course_id)
-    student = Student.objects.get(user=request.user)
-    if student in course.students.all():
-        course.students.remove(student)
-    else:
-        course.students.add(student)
+    toggle_course(get_role(request.user).student_id, course.id)
     return redirect('course_list')
 
 
@@ -156,12 +177,14 @@ def add_review(request, course_id):
 @login_required
 @user_passes_test(lecturer_required)
 def lecturer_dashboard(request):
-    lecturer = Profile.objects.get(user=request.user)
-    courses = Course.objects.filter(lecturer=lecturer.name)
+    lecturer = get_role(request.user)
+    courses = Course.objects.filter(lecturer_id=lecturer.profile_id).select_related('stats')
 
     context = {
         'lecturer': lecturer,
-        'courses': courses
+        'courses': courses,
+        'versions': fragment_versions({'courses': ['courses', 'grades', 'reviews', 'enrollments']}),
+        'fragment_ttl': settings.REPORTS_FRAGMENT_CACHE_TTL,
     }
     return render(request, 'reports/lecturer_dashboard.html', context)
 
@@ -173,83 +196,58 @@ def student_dashboard(request):
 
 
 @login_required
-@user_passes_test(lambda u: hasattr(u, 'profile') and u.profile.role == 'admin')
+@user_passes_test(admin_required)
 def admin_dashboard(request):
-    courses = Course.objects.all().order_by('-id')
-    students = Student.objects.all()
-    grades = Grade.objects.all()
-
-    # basic stats
-    total_students = students.count()
-    total_lecturers = Profile.objects.filter(role='lecturer').count()
-    total_courses = courses.count()
-    total_grades = grades.count()
-
-    # recent courses (limit 8)
-    recent_courses = courses[:8]
-
-    # simple top students sample: compute GPA per student and pick top 5
-    top_students = []
-    for student in students:
-        gset = Grade.objects.filter(student=student)
-        total_points = sum((g.grade_point or 0) * g.course.credit_units for g in gset)
-        total_units = sum(g.course.credit_units for g in gset)
-        gpa = round(total_points / total_units, 2) if total_units > 0 else 0
-         
-        top_students.append({'student': student, 'gpa': gpa})
-    top_students = sorted(top_students, key=lambda x: x['gpa'], reverse=True)[:5]
-
+    # Each block is cached until the data it shows changes (see
+    # fragments.py); the stats are only computed for blocks being rendered
     context = {
-        'courses': courses,
-        'students': students,
-        'total_students': total_students,
-        'total_lecturers': total_lecturers,
-        'total_courses': total_courses,
-        'total_grades': total_grades,
-        'recent_courses': recent_courses,
-        'top_students': top_students,
-        
+        'versions': fragment_versions({
+            'stats': ['students', 'profiles', 'courses', 'grades'],
+            'recent_courses': ['courses', 'profiles', 'grades', 'enrollments'],
+            'top_students': ['students', 'grades'],
+        }),
+        'fragment_ttl': settings.REPORTS_FRAGMENT_CACHE_TTL,
+        'total_students': lazy(Student.objects.count),
+        'total_lecturers': lazy(Profile.objects.filter(role='lecturer').count),
+        'total_courses': lazy(Course.objects.count),
+        'total_grades': lazy(Grade.objects.count),
+        # recent courses (limit 8)
+        'recent_courses': lazy(lambda: list(Course.objects.select_related('lecturer', 'stats').order_by('-id')[:8])),
+        # top 5 students by CGPA, the stored Student.gpa (ORDER BY ... LIMIT 5)
+        'top_students': lazy(lambda: top_students(limit=5)),
     }
     return render(request, 'reports/admin_dashboard.html', context)
 
 @login_required
 @user_passes_test(admin_required)
 def admin_courses(request):
-    courses = Course.objects.all()
+    # Totals come from the CourseStats table, one row per course
+    courses = Course.objects.select_related('lecturer', 'stats')
     return render(request, 'reports/admin_courses.html', {'courses': courses})
 
 @login_required
 @user_passes_test(admin_required)
 def admin_students(request):
-    students = Student.objects.all()
-    students_with_gpa = []
-
-    for student in students:
-        student_grades = Grade.objects.filter(student=student)
-        total_points = sum((g.grade_point or 0) * g.course.credit_units for g in student_grades)
-        total_units = sum(g.course.credit_units for g in student_grades)
-        gpa = round(total_points / total_units, 2) if total_units > 0 else 0
-
-        # For simplicity, CGPA = GPA here (or calculate across semesters if available)
-        cgpa = gpa
-
-        students_with_gpa.append({
-            'student': student,
-            'gpa': gpa,
-            'cgpa': cgpa,
-        })
-
+    # One keyset page of students, then their enrollment counts in one
+    # grouped query over just that page (grouping before the LIMIT would
+    # scan every student) and GPA/CGPA from gpa_summary
+    page = keyset_page(Student.objects.all(), request)
+    students = Student.objects.filter(pk__in=[s.pk for s in page['items']]).annotate(
+        enrollment_count=Count('courses', distinct=True)
+    ).order_by('pk')
     return render(request, 'reports/admin_students.html', {
-        'students_with_gpa': students_with_gpa
+        'students_with_gpa': students_with_gpa(students),
+        'page': page,
     })
 
 @login_required
 @user_passes_test(admin_required)
 def student_report(request, student_id):
-    student = get_object_or_404(Student, id=student_id)
-    grades = Grade.objects.filter(student=student)
-    gpa = calculate_gpa(student)
-    cgpa = calculate_cgpa(student)
+    student = get_object_or_404(with_grades(Student.objects.all()), id=student_id)
+    grades = student.grade_set.all()
+    summary = gpa_summary(student)
+    gpa = summary['gpa']
+    cgpa = summary['cgpa']
 
     context = {
         'student': student,
@@ -263,25 +261,31 @@ def student_report(request, student_id):
 @login_required
 @user_passes_test(admin_required)
 def admin_grades(request):
-    grades = Grade.objects.all()
-    return render(request, 'reports/admin_grades.html', {'grades': grades})
+    # One page at a time, with student/course names joined in
+    grades = Grade.objects.select_related('student', 'course').only(
+        'score', 'letter', 'student__name', 'course__name'
+    )
+    page = keyset_page(grades, request)
+    return render(request, 'reports/admin_grades.html', {'grades': page['items'], 'page': page})
 
 @login_required
 @user_passes_test(admin_required)
 def admin_reviews(request):
-    reviews = CourseReview.objects.all()
-    return render(request, 'reports/admin_reviews.html', {'reviews': reviews})
+    reviews = CourseReview.objects.select_related('student', 'course').only(
+        'rating', 'comment', 'student__name', 'course__name', 'course__code'
+    )
+    page = keyset_page(reviews, request)
+    return render(request, 'reports/admin_reviews.html', {'reviews': page['items'], 'page': page})
 
 
 @login_required
 @user_passes_test(admin_required)
 def admin_lecturers(request):
-    lecturers = Profile.objects.filter(role='lecturer')
-    courses = Course.objects.all()  # fetch all courses
+    # Each lecturer with their courses, via the Course.lecturer reverse FK
+    lecturers = Profile.objects.filter(role='lecturer').select_related('user').prefetch_related('courses')
 
     context = {
         'lecturers': lecturers,
-        'courses': courses,  # pass to template
     }
 
     return render(request, 'reports/admin_lecturers.html', context)
@@ -293,7 +297,7 @@ def create_course(request):
         form = CourseForm(request.POST)
         if form.is_valid():
             course = form.save(commit=False)
-            course.lecturer = request.user.profile.name
+            course.lecturer_id = get_role(request.user).profile_id
             course.save()
             return redirect('admin_dashboard')
     else:
@@ -314,9 +318,7 @@ def add_lecturer(request):
             lecturer = lecturer.objects.create(user=user)
 
             # Assign selected courses
-            selected_courses = Course.objects.filter(id__in=course_ids)
-            lecturer.courses.set(selected_courses)
-            lecturer.save()
+            Course.objects.filter(id__in=course_ids).update(lecturer=lecturer)
 
             messages.success(request, f'Lecturer {name} added successfully with assigned courses!')
             return redirect('admin_lecturers')
@@ -337,14 +339,14 @@ def admin_create_course(request):
         name = request.POST.get('name')
         code = request.POST.get('code')
         credit_units = request.POST.get('credit_units')
-        lecturer_name = request.POST.get('lecturer')  # select from dropdown maybe
+        lecturer_id = request.POST.get('lecturer')  # select from dropdown maybe
 
-        if name and code and credit_units and lecturer_name:
+        if name and code and credit_units and lecturer_id:
             Course.objects.create(
                 name=name,
                 code=code,
                 credit_units=credit_units,
-                lecturer=lecturer_name
+                lecturer=get_object_or_404(Profile, id=lecturer_id, role='lecturer')
             )
             messages.success(request, 'Course added successfully!')
             return redirect('admin_dashboard')
@@ -354,27 +356,44 @@ def admin_create_course(request):
     lecturers = Profile.objects.filter(role='lecturer')
     return render(request, 'reports/admin_create_course.html', {'lecturers': lecturers})
 
+@login_required
+@user_passes_test(admin_required)
+def admin_bulk_enroll(request):
+    result = None
+    if request.method == 'POST':
+        form = BulkEnrollmentForm(request.POST, request.FILES)
+        if form.is_valid():
+            result = import_enrollments(form.rows())
+    else:
+        form = BulkEnrollmentForm()
+    return render(request, 'reports/admin_bulk_enroll.html', {'form': form, 'result': result})
+
+@login_required
+@user_passes_test(admin_required)
+def admin_query_profile(request):
+    # Query counts per reports view since the process started (or the last reset)
+    if request.method == 'POST':
+        reset_stats()
+        return redirect('admin_query_profile')
+    return render(request, 'reports/admin_query_profile.html', {
+        'stats': view_stats(),
+        'default_budget': budget_for(None),
+        'repeat_threshold': repeat_threshold(),
+    })
+
 @login_required
 @user_passes_test(admin_required)
 def admin_course_students(request, course_id):
     course = get_object_or_404(Course, id=course_id)
 
-    # Students explicitly enrolled via ManyToMany
-    students_from_m2m = list(course.students.all())
-    # Students who have grades (may not be in M2M)
-    students_from_grades = [grade.student for grade in Grade.objects.filter(course=course)]
-    # Merge and remove duplicates
-    students = list({student.id: student for student in students_from_m2m + students_from_grades}.values())
-
-    # Prepare data for template
-    students_with_grades = []
-    for student in students:
-        grade = Grade.objects.filter(student=student, course=course).first()
-        students_with_grades.append({'student': student, 'grade': grade})
+    # Enrolled and graded students with their grade, one page at a time
+    page = keyset_page(course_roster(course), request)
+    students_with_grades = roster_entries(page['items'], course)
 
     return render(request, 'reports/admin_course_students.html', {
         'course': course,
-        'students_with_grades': students_with_grades
+        'students_with_grades': students_with_grades,
+        'page': page,
     })
 
 
@@ -407,10 +426,10 @@ def edit_lecturer(request, lecturer_id):
             lecturer.user.set_password(password)
         lecturer.user.save()
 
-        # Update assigned courses
-        selected_courses = Course.objects.filter(id__in=course_ids)
-        lecturer.courses.set(selected_courses)
-        lecturer.save()
+        # Update assigned courses: unassign the deselected ones, assign the rest
+        lecturer.courses.exclude(id__in=course_ids).update(lecturer=None)
+        Course.objects.filter(id__in=course_ids).update(lecturer=lecturer)
+        bump('courses')
 
         messages.success(request, f"Lecturer {name}'s details were updated successfully.")
         return redirect('admin_lecturers')
@@ -424,19 +443,17 @@ def edit_lecturer(request, lecturer_id):
 
 @login_required
 def login_redirect(request):
-    profile = request.user.profile
-
-    if profile.role == 'student':
-        # Find the corresponding Student instance
-        try:
-            student = Student.objects.get(email=request.user.email)
-            return redirect('student_detail', student_id=student.id)
-        except Student.DoesNotExist:
-            # fallback if Student record missing
-            return redirect('lecturer_dashboard')
-    elif profile.role == 'lecturer':
+    role = get_role(request.user)
+
+    if role.role == 'student':
+        # The Student linked to this user, resolved by RoleMiddleware
+        if role.student_id is not None:
+            return redirect('student_detail', student_id=role.student_id)
+        # fallback if Student record missing
+        return redirect('lecturer_dashboard')
+    elif role.role == 'lecturer':
         return redirect('lecturer_dashboard')
-    elif profile.role == 'admin':
+    elif role.role == 'admin':
         return redirect('admin_dashboard')
     
 
@@ -449,11 +466,6 @@ def logout_view(request):
 def course_students(request, course_id):
     course = get_object_or_404(Course, id=course_id)
 
-    # Students explicitly enrolled via M2M
-    students_from_m2m = list(course.students.all())
-    students_from_grades = [grade.student for grade in Grade.objects.filter(course=course)]
-    students = list({student.id: student for student in students_from_m2m + students_from_grades}.values())
-
     # Handle grade submission
     if request.method == 'POST':
         student_id = request.POST.get('student_id')
@@ -467,21 +479,44 @@ def course_students(request, course_id):
     
     
 
-    # Prepare data for template
-    students_with_grades = []
-    for student in students:
-        grade = Grade.objects.filter(student=student, course=course).first()
-        students_with_grades.append({'student': student, 'grade': grade})
+    # Enrolled and graded students with their grade, one page at a time
+    page = keyset_page(course_roster(course), request)
+    students_with_grades = roster_entries(page['items'], course)
 
     return render(request, 'reports/course_students.html', {
         'course': course,
-        'students_with_grades': students_with_grades
+        'students_with_grades': students_with_grades,
+        'page': page,
     })
 
 
 
     
 
+@login_required
+@user_passes_test(lecturer_required)
+def bulk_grades(request, course_id):
+    # Only the course's own lecturer may grade it
+    course = get_object_or_404(Course, id=course_id, lecturer_id=get_role(request.user).profile_id)
+    roster = course_roster(course).order_by('name')
+
+    if request.method == 'POST':
+        form = BulkGradeForm(request.POST, request.FILES, roster=roster)
+        if form.is_valid():
+            count = save_course_grades(course, form.cleaned_data['scores'])
+            messages.success(request, f'Saved {count} grades for {course.name}.')
+            return redirect('course_students', course_id=course.id)
+    else:
+        roster = list(roster)
+        form = BulkGradeForm(
+            roster=roster,
+            initial={f'score_{student.id}': student.roster_score for student in roster},
+        )
+
+    rows = [(student, form[f'score_{student.id}']) for student in form.roster]
+    return render(request, 'reports/bulk_grades.html', {'course': course, 'form': form, 'rows': rows})
+
+
 @login_required
 @user_passes_test(lecturer_required)  # Make sure this decorator exists
 def update_grade(request, course_id, student_id):
@@ -510,7 +545,7 @@ def update_grade(request, course_id, student_id):
 @user_passes_test(lecturer_required)  # ensures only lecturers can access
 def course_reviews(request, course_id):
     # Make sure the course belongs to this lecturer
-    course = get_object_or_404(Course, id=course_id, lecturer=request.user.profile.name)
+    course = get_object_or_404(Course, id=course_id, lecturer_id=get_role(request.user).profile_id)
     
     # Fetch reviews efficiently with related student info
     reviews = CourseReview.objects.filter(course=course).select_related('student')
@@ -525,7 +560,7 @@ def create_course(request):
         form = CourseForm(request.POST)
         if form.is_valid():
             course = form.save(commit=False)
-            course.lecturer = request.user.profile.name
+            course.lecturer_id = get_role(request.user).profile_id
             course.save()
             return redirect('lecturer_dashboard')
     else:
@@ -534,47 +569,47 @@ def create_course(request):
 
 
 @login_required
+@user_passes_test(course_staff_required)
 def edit_course(request, course_id):
     course = get_object_or_404(Course, id=course_id)
 
     # Optional: Restrict lecturers to only edit their own courses
-    if hasattr(request.user, 'profile'):
-        if request.user.profile.role == 'lecturer' and course.lecturer != request.user.profile:
-            return redirect('lecturer_dashboard')
+    role = get_role(request.user)
+    if role.role == 'lecturer' and course.lecturer_id != role.profile_id:
+        return redirect('lecturer_dashboard')
 
     if request.method == 'POST':
-        course.name = request.POST.get('name')
-        course.code = request.POST.get('code')
-        course.credit_units = request.POST.get('credit_units')
-
-        lecturer_id = request.POST.get('lecturer')
-        if lecturer_id:
-            course.lecturer = get_object_or_404(Profile, id=lecturer_id)
+        form = CourseEditForm(request.POST, instance=course)
+        if form.is_valid():
+            course = form.save(commit=False)
+            lecturer_id = request.POST.get('lecturer')
+            if lecturer_id:
+                course.lecturer = get_object_or_404(Profile, id=lecturer_id, role='lecturer')
 
-        course.save()
+            course.save()
 
-        # Redirect based on who made the edit
-        if request.user.profile.role == 'lecturer':
-            return redirect('lecturer_dashboard')
-        else:
-            return redirect('courses_management')
+            # Redirect based on who made the edit
+            if role.role == 'lecturer':
+                return redirect('lecturer_dashboard')
+            else:
+                return redirect('admin_courses')
+    else:
+        form = CourseEditForm(instance=course)
 
     lecturers = Profile.objects.filter(role='lecturer')
-    return render(request, 'reports/edit_course.html', {'course': course, 'lecturers': lecturers})
+    return render(request, 'reports/edit_course.html', {'course': course, 'form': form, 'lecturers': lecturers})
 
 @login_required
 @user_passes_test(student_required)
 def submit_review(request, course_id):
-    #student = request.user.profile.student  # get the logged-in student
-    
-    student = Student.objects.get(email=request.user.email)
+    student_id = get_role(request.user).student_id  # the logged-in student
     course = get_object_or_404(Course, id=course_id)
 
     # Rating options
     rating_choices = [1, 2, 3, 4, 5]
 
     # Get existing review if any
-    review = CourseReview.objects.filter(student=student, course=course).first()
+    review = CourseReview.objects.filter(student_id=student_id, course=course).first()
 
     if request.method == 'POST':
         rating = int(request.POST['rating'])
@@ -584,14 +619,14 @@ def submit_review(request, course_id):
             review.comment = comment
             review.save()
         else:
-            CourseReview.objects.create(student=student, course=course, rating=rating, comment=comment)
-        return redirect('student_detail', student_id=student.id)
+            CourseReview.objects.create(student_id=student_id, course=course, rating=rating, comment=comment)
+        return redirect('student_detail', student_id=student_id)
 
     context = {
         'course': course,
         'review': review,
         'rating_choices': rating_choices,
-        'student': student,
+        'student_id': student_id,
     }
     return render(request, 'reports/submit_review.html', context)
 
@@ -599,376 +634,63 @@ def submit_review(request, course_id):
 @login_required
 @user_passes_test(student_required)
 def my_courses(request):
-    student = request.user.profile
-    courses = student.courses.all()  # ManyToManyField
+    courses = Course.objects.filter(students__id=get_role(request.user).student_id).select_related('lecturer')
     return render(request, 'reports/my_courses.html', {'courses': courses})
 
 
 
-#csv donload views
+#csv donload views (streamed, see exports.py)
 
 def download_courses_csv(request):
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="courses.csv"'
-    writer = csv.writer(response)
-    writer.writerow(['Course Name', 'Code', 'Credit Units', 'Lecturer'])
-
-    for course in Course.objects.all():
-        writer.writerow([course.name, course.code, course.credit_units, course.lecturer])
-
-    return response
+    return stream_export('courses')
 
 
 def download_students_per_course_csv(request):
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="students_per_course.csv"'
-    writer = csv.writer(response)
-    writer.writerow(['Course', 'Student Name', 'Email'])
-
-    for course in Course.objects.all():
-        for student in course.students.all():
-            writer.writerow([course.name, student.name, student.email])
-
-    return response
+    return stream_export('students_per_course')
 
 
 def download_reviews_csv(request):
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="course_reviews.csv"'
-    writer = csv.writer(response)
-    writer.writerow(['Course', 'Student', 'Rating', 'Comment'])
-
-    for review in CourseReview.objects.all():
-        writer.writerow([review.course.name, review.student.name, review.rating, review.comment])
-
-    return response
+    return stream_export('reviews')
 
 
 def download_summary_csv(request):
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="system_summary.csv"'
-    writer = csv.writer(response)
-    writer.writerow(['Summary Type', 'Count'])
-
-    writer.writerow(['Total Courses', Course.objects.count()])
-    writer.writerow(['Total Students', sum(c.students.count() for c in Course.objects.all())])
-    writer.writerow(['Total Lecturers', len(set(c.lecturer for c in Course.objects.all() if c.lecturer))])
-    writer.writerow(['Total Reviews', CourseReview.objects.count()])
-
-    return response
-
-from django.shortcuts import render,  get_object_or_404, redirect
-from django.contrib.auth.decorators import login_required, user_passes_test
-from .decorators import student_required, lecturer_required, admin_required
-from .models import Student, Grade, Course, CourseReview
-from django.contrib.auth import authenticate, login, logout
-from .forms import CourseForm
-
-
-# Create your views here.
-
-def student_list(request):
-    students = Student.objects.all()
-    return render(request, "reports/student_list.html", {"students": students})
-
-
-
-@login_required
-@user_passes_test(student_required)
-def student_detail(request, student_id):
-    student = get_object_or_404(Student, id=student_id)
-
-    # Courses enrolled via ManyToManyField
-    enrolled_courses_m2m = list(student.courses.all())
-
-    # Courses that the student has grades for
-    courses_with_grades = list(Course.objects.filter(grade__student=student).distinct())
-
-    # Merge the two lists, remove duplicates
-    enrolled_courses = list({c.id: c for c in enrolled_courses_m2m + courses_with_grades}.values())
-
-    # Available courses for enrollment (exclude already enrolled)
-    available_courses = Course.objects.exclude(id__in=[c.id for c in enrolled_courses])
-
-    # Handle enroll/unenroll
-    if request.method == 'POST':
-        course_id = request.POST.get('course_id')
-        course = get_object_or_404(Course, id=course_id)
-        if student in course.students.all():
-            course.students.remove(student)
-        else:
-            course.students.add(student)
-        return redirect('student_detail', student_id=student.id)
-
-    # Grades and reviews
-    grades = Grade.objects.filter(student=student)
-
-    # Prepare a list for template
-    courses_with_reviews = []
-    for course in enrolled_courses:
-        review = course.reviews.filter(student=student).first()
-        courses_with_reviews.append({
-            'course': course,
-            'review': review
-        })
-
-    context = {
-        'student': student,
-        'enrolled_courses': enrolled_courses,
-        'available_courses': available_courses,
-        'grades': grades,
-        
-    }
-    return render(request, 'reports/student_detail.html', context)
-
-@login_required
-@user_passes_test(student_required)
-def course_list(request, student_id):
-    student = get_object_or_404(Student, id=student_id)
-
-    # Courses the student already has grades for
-    graded_course_ids = Grade.objects.filter(student=student).values_list('course_id', flat=True)
-
-    # Courses available to enroll (not graded yet)
-    available_courses = Course.objects.exclude(id__in=graded_course_ids)
-
-    # Optional search/filter
-    query = request.GET.get('q')
-    if query:
-        available_courses = available_courses.filter(name__icontains=query)
-
-    # Handle enroll/unenroll
-    if request.method == 'POST':
-        course_id = request.POST.get('course_id')
-        course = get_object_or_404(Course, id=course_id)
-        if student in course.students.all():
-            course.students.remove(student)
-        else:
-            course.students.add(student)
-        return redirect('course_list', student_id=student.id)  # back to the same page
-
-    context = {
-        'student': student,
-        'available_courses': available_courses,
-        'query': query or "",
-    }
-    return render(request, 'reports/course_list.html', context)
-
-
-def toggle_enrollment(request, course_id):
-    course = get_object_or_404(Course, id=course_id)
-    student = Student.objects.get(user=request.user)
-    if student in course.students.all():
-        course.students.remove(student)
-    else:
-        course.students.add(student)
-    return redirect('course_list')
-
-
-@login_required
-def add_review(request, course_id):
-    student = get_object_or_404(Student, user=request.user)
-    course = get_object_or_404(Course, id=course_id)
-    enrolled_courses = student.courses.all()  # all courses student is enrolled in
-    reviews = CourseReview.objects.filter(student=student)
-
-    if request.method == 'POST':
-        rating = request.POST.get('rating')
-        comment = request.POST.get('comment')
+    return stream_export('summary')
 
-        # Update existing review or create new
-        review, created = CourseReview.objects.update_or_create(
-            student=student,
-            course=course,
-            defaults={'rating': rating, 'comment': comment}
-        )
-        return redirect('student_detail', student_id=student.id)
 
-    return render(request, 'reports/add_review.html', {
-        'student': student,
-        'enrolled_courses': enrolled_courses,
-        'reviews': reviews,
-        'selected_course': course  # new
-    })
-
-@login_required
-@user_passes_test(student_required)
-def student_dashboard(request):
-    # student-specific actions
-    return render(request, 'students/student_detail.html')
-
-@login_required
-@user_passes_test(lecturer_required)
-def lecturer_dashboard(request):
-    lecturer_name = request.user.username  # assuming lecturer name = username
-    courses = Course.objects.filter(lecturer=request.user)
-    return render(request, 'reports/lecturer_dashboard.html', {'courses': courses})
+# Background exports (see export_jobs.py): start one, watch it, fetch the file
 
 @login_required
 @user_passes_test(admin_required)
-def admin_dashboard(request):
-    # Example: admin can manage everything
-    students = Student.objects.all()
-    courses = Course.objects.all()
-    return render(request, 'reports/admin_dashboard.html', {'students': students, 'courses': courses})
-
+def admin_export_submit(request, kind):
+    if request.method != 'POST' or kind not in EXPORTS:
+        raise Http404
+    job = submit_export(kind, request.user)
+    return redirect('admin_export_job', job_id=job.id)
 
 
 @login_required
-def login_redirect(request):
-    profile = request.user.profile
-
-    if profile.role == 'student':
-        # Find the corresponding Student instance
-        try:
-            student = Student.objects.get(email=request.user.email)
-            return redirect('student_detail', student_id=student.id)
-        except Student.DoesNotExist:
-            # fallback if Student record missing
-            return redirect('lecturer_dashboard')
-    elif profile.role == 'lecturer':
-        return redirect('lecturer_dashboard')
-    elif profile.role == 'admin':
-        return redirect('admin_dashboard')
-    
-
-def logout_view(request):
-    logout(request)
-    return redirect('login')
-
-@login_required
-@user_passes_test(lecturer_required)
-def course_students(request, course_id):
-    course = get_object_or_404(Course, id=course_id)
-
-    # Students explicitly enrolled via M2M
-    students_from_m2m = list(course.students.all())
-    students_from_grades = [grade.student for grade in Grade.objects.filter(course=course)]
-    students = list({student.id: student for student in students_from_m2m + students_from_grades}.values())
-
-    # Handle grade submission
-    if request.method == 'POST':
-        student_id = request.POST.get('student_id')
-        score = request.POST.get('score')
-        student = get_object_or_404(Student, id=student_id)
-        grade, created = Grade.objects.get_or_create(student=student, course=course, defaults={'score': score})
-        if not created:
-            grade.score = score
-            grade.save()
-        return redirect('course_students', course_id=course.id)
-
-    # Prepare data for template
-    students_with_grades = []
-    for student in students:
-        grade = Grade.objects.filter(student=student, course=course).first()
-        students_with_grades.append({'student': student, 'grade': grade})
+@user_passes_test(admin_required)
+def admin_export_job(request, job_id):
+    job = get_object_or_404(ExportJob, id=job_id)
+    return render(request, 'reports/admin_export_job.html', {'job': job})
 
-    return render(request, 'reports/course_students.html', {
-        'course': course,
-        'students_with_grades': students_with_grades
-    })
 
 @login_required
-@user_passes_test(lecturer_required)  # Make sure this decorator exists
-def update_grade(request, course_id, student_id):
-    course = get_object_or_404(Course, id=course_id)
-    student = get_object_or_404(Student, id=student_id)
-
-    # Get or create the grade object
-    grade, created = Grade.objects.get_or_create(student=student, course=course)
-
-    if request.method == 'POST':
-        score = request.POST.get('score')
-        if score:
-            grade.score = int(score)
-            grade.save()
-        # Redirect back to the students list to show updated grade
-        return redirect('course_students', course_id=course.id)
-
-    return render(request, 'reports/update_grade.html', {
-        'grade': grade,
-        'student': student,
-        'course': course
+@user_passes_test(admin_required)
+def admin_export_status(request, job_id):
+    job = get_object_or_404(ExportJob, id=job_id)
+    return JsonResponse({
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'row_count': job.row_count,
+        'error': job.error,
+        'download_url': reverse('admin_export_download', args=[job.id]) if job.status == ExportJob.DONE else None,
     })
 
 
 @login_required
-@user_passes_test(lecturer_required)  # ensures only lecturers can access
-def course_reviews(request, course_id):
-    # Make sure the course belongs to this lecturer
-    course = get_object_or_404(Course, id=course_id, lecturer=request.user)
-    
-    # Fetch reviews efficiently with related student info
-    reviews = CourseReview.objects.filter(course=course).select_related('student')
-    
-    return render(request, 'reports/course_reviews.html', {'course': course, 'reviews': reviews})
-
-
-@login_required
-@user_passes_test(lecturer_required)
-def create_course(request):
-    if request.method == 'POST':
-        form = CourseForm(request.POST)
-        if form.is_valid():
-            course = form.save(commit=False)
-            course.lecturer = request.user
-            course.save()
-            return redirect('lecturer_dashboard')
-    else:
-        form = CourseForm()
-    return render(request, 'reports/create_course.html', {'form': form})
-
-@login_required
-@user_passes_test(lecturer_required)
-def edit_course(request, course_id):
-    course = get_object_or_404(Course, id=course_id, lecturer=request.user)
-    if request.method == 'POST':
-        form = CourseForm(request.POST, instance=course)
-        if form.is_valid():
-            form.save()
-            return redirect('lecturer_dashboard')
-    else:
-        form = CourseForm(instance=course)
-    return render(request, 'reports/edit_course.html', {'form': form, 'course': course})
-
-@login_required
-@user_passes_test(student_required)
-def submit_review(request, course_id):
-    #student = request.user.profile.student  # get the logged-in student
-    
-    student = Student.objects.get(email=request.user.email)
-    course = get_object_or_404(Course, id=course_id)
-
-    # Rating options
-    rating_choices = [1, 2, 3, 4, 5]
-
-    # Get existing review if any
-    review = CourseReview.objects.filter(student=student, course=course).first()
-
-    if request.method == 'POST':
-        rating = int(request.POST['rating'])
-        comment = request.POST['comment'].strip()
-        if review:
-            review.rating = rating
-            review.comment = comment
-            review.save()
-        else:
-            CourseReview.objects.create(student=student, course=course, rating=rating, comment=comment)
-        return redirect('student_detail', student_id=student.id)
-
-    context = {
-        'course': course,
-        'review': review,
-        'rating_choices': rating_choices,
-        'student': student,
-    }
-    return render(request, 'reports/submit_review.html', context)
-
-
-@login_required
-@user_passes_test(student_required)
-def my_courses(request):
-    student = request.user.profile
-    courses = student.courses.all()  # ManyToManyField
-    return render(request, 'reports/my_courses.html', {'courses': courses})
-
+@user_passes_test(admin_required)
+def admin_export_download(request, job_id):
+    job = get_object_or_404(ExportJob, id=job_id, status=ExportJob.DONE)
+    return FileResponse(job.file.open('rb'), as_attachment=True, filename=EXPORTS[job.kind][0], content_type='text/csv')
@@ -43,10 +43,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'reports.profiling.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'reports.middleware.RoleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -78,6 +80,12 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Take the write lock when a transaction starts, so concurrent
+        # enrollments queue on it instead of failing with "database is locked"
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
@@ -119,11 +127,56 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Cache for the dashboard fragments, role lookups and summary counts.
+# Local memory is per process: with several worker processes point this at
+# a shared backend (Redis, Memcached) so invalidation reaches all of them.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'studentportals',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+# Generated files (export jobs write under MEDIA_ROOT/exports/)
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+
+# Reports
+
+# Seconds to cache the summary CSV counts (0 disables caching)
+REPORTS_SUMMARY_CACHE_TTL = 60
+
+# Seconds a user's role/Student lookup is kept in their session (0 looks it
+# up on every request)
+REPORTS_ROLE_CACHE_TTL = 300
+
+# Background export jobs: pool threads (0 runs each job inline when it is
+# submitted) and the window in which identical requests share one job
+REPORTS_EXPORT_WORKERS = 2
+REPORTS_EXPORT_DEDUPE_SECONDS = 60
+# Seconds a finished export and its file are kept (0 keeps them forever)
+REPORTS_EXPORT_RETENTION_SECONDS = 24 * 60 * 60
+
+# Query profiling for the reports views (see reports/profiling.py): the
+# query budget per request, overrides by URL name, and how often one query
+# may repeat in a request before it is flagged as a likely N+1. Profiling
+# wraps every query of every request, so it only runs with DEBUG on
+REPORTS_QUERY_PROFILING = DEBUG
+REPORTS_QUERY_BUDGET = 20
+REPORTS_QUERY_BUDGETS = {}
+REPORTS_QUERY_REPEAT_THRESHOLD = 5
+
+# Seconds a cached dashboard block is kept; it is replaced sooner whenever
+# the data it shows changes (see reports/fragments.py). 0 disables caching.
+REPORTS_FRAGMENT_CACHE_TTL = 600
+
 """
 Django settings for studetPortals project.
 
@@ -168,10 +221,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'reports.profiling.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'reports.middleware.RoleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -203,6 +258,12 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Take the write lock when a transaction starts, so concurrent
+        # enrollments queue on it instead of failing with "database is locked"
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
@@ -244,8 +305,53 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Cache for the dashboard fragments, role lookups and summary counts.
+# Local memory is per process: with several worker processes point this at
+# a shared backend (Redis, Memcached) so invalidation reaches all of them.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'studentportals',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+# Generated files (export jobs write under MEDIA_ROOT/exports/)
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+
+# Reports
+
+# Seconds to cache the summary CSV counts (0 disables caching)
+REPORTS_SUMMARY_CACHE_TTL = 60
+
+# Seconds a user's role/Student lookup is kept in their session (0 looks it
+# up on every request)
+REPORTS_ROLE_CACHE_TTL = 300
+
+# Background export jobs: pool threads (0 runs each job inline when it is
+# submitted) and the window in which identical requests share one job
+REPORTS_EXPORT_WORKERS = 2
+REPORTS_EXPORT_DEDUPE_SECONDS = 60
+# Seconds a finished export and its file are kept (0 keeps them forever)
+REPORTS_EXPORT_RETENTION_SECONDS = 24 * 60 * 60
+
+# Query profiling for the reports views (see reports/profiling.py): the
+# query budget per request, overrides by URL name, and how often one query
+# may repeat in a request before it is flagged as a likely N+1. Profiling
+# wraps every query of every request, so it only runs with DEBUG on
+REPORTS_QUERY_PROFILING = DEBUG
+REPORTS_QUERY_BUDGET = 20
+REPORTS_QUERY_BUDGETS = {}
+REPORTS_QUERY_REPEAT_THRESHOLD = 5
+
+# Seconds a cached dashboard block is kept; it is replaced sooner whenever
+# the data it shows changes (see reports/fragments.py). 0 disables caching.
+REPORTS_FRAGMENT_CACHE_TTL = 600
+